@@ -0,0 +1,254 @@
+"""
+Daily receipt archives.
+
+Packs the loose PDFs of closed days, Receipts/<yyyy-mm-dd>/*.pdf, into one
+append-only pack file per day, Archive/<yyyy-mm-dd>.pack. Each receipt is
+stored as a small header (magic, name length, size), its file name and the
+PDF bytes, one after another. The offset and size of every receipt goes
+into an index, Archive/index.db, so a receipt is read back by invoice
+number with one seek and one read, without unpacking anything; the packs
+are self-describing, so the index can be rebuilt from them (reindex).
+
+Receipts can also be appended to a pack directly (see storage.ArchiveSink).
+Packing is safe to interrupt: receipts are appended and the pack is synced
+to disk before they are indexed, and only indexed files are deleted. The
+next run cuts off anything appended after the last indexed receipt and
+packs the remaining loose files again. Receipts added to a day after it
+was packed are appended to the same pack on the next run.
+
+Usage:
+    python archive.py pack                       # pack every day before today
+    python archive.py pack --before 2024-09-01
+    python archive.py get INV20240915-000042 -o copy.pdf
+"""
+from datetime import date
+import argparse
+import os
+import sqlite3
+import struct
+import sys
+
+RECEIPTS_DIR = "Receipts"
+ARCHIVE_DIR = "Archive"
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS receipts (
+    invoice_number TEXT NOT NULL,
+    name TEXT NOT NULL,          -- receipt file name
+    day TEXT NOT NULL,           -- yyyy-mm-dd, names the pack
+    offset INTEGER NOT NULL,     -- where the PDF bytes start in the pack
+    size INTEGER NOT NULL,
+    PRIMARY KEY (invoice_number, name)
+);
+CREATE INDEX IF NOT EXISTS idx_receipts_day ON receipts (day);
+"""
+
+PACK_MAGIC = b"RCPT"
+ENTRY_HEADER = struct.Struct("<4sHI")  # Magic, file name length, PDF size
+
+
+def invoice_number_from_name(name):
+    """receipt_<invoice number>_<customer>.pdf -> invoice number."""
+    stem = name[len("receipt_"):] if name.startswith("receipt_") else name
+    number = stem.split("_", 1)[0]
+    return number[:-len(".pdf")] if number.endswith(".pdf") else number
+
+
+def pack_entries(pack_path):
+    """
+    Yields (name, data offset, size) for every complete receipt in a pack file.
+    """
+    with open(pack_path, "rb") as f:
+        while True:
+            header = f.read(ENTRY_HEADER.size)
+            if len(header) < ENTRY_HEADER.size:
+                return
+            magic, name_length, size = ENTRY_HEADER.unpack(header)
+            if magic != PACK_MAGIC:
+                return  # Torn tail from an interrupted append
+            name = f.read(name_length).decode("utf-8")
+            offset = f.tell()
+            if f.seek(size, os.SEEK_CUR) > os.fstat(f.fileno()).st_size:
+                return
+            yield name, offset, size
+
+
+class Archive:
+    def __init__(self, path=ARCHIVE_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(path, "index.db"))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(INDEX_SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def pack_path(self, day):
+        return os.path.join(self.path, f"{day}.pack")
+
+    def append(self, day, receipts):
+        """
+        Appends (file name, PDF bytes) pairs to the day's pack, syncs it and indexes them.
+        Returns the number appended.
+        """
+        # Where this day's pack ends, according to the index
+        end = self.db.execute("SELECT MAX(offset + size) FROM receipts WHERE day = ?", (day,)).fetchone()[0] or 0
+
+        entries = []
+        with open(self.pack_path(day), "a+b") as f:
+            f.truncate(end)  # Drop anything appended after the last indexed receipt
+            f.seek(end)
+            for name, data in receipts:
+                encoded_name = name.encode("utf-8")
+                f.write(ENTRY_HEADER.pack(PACK_MAGIC, len(encoded_name), len(data)) + encoded_name)
+                entries.append((invoice_number_from_name(name), name, day, f.tell(), len(data)))
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO receipts (invoice_number, name, day, offset, size) VALUES (?, ?, ?, ?, ?)",
+                entries,
+            )
+        return len(entries)
+
+    def pack_day(self, day_folder, day):
+        """
+        Moves every PDF in day_folder into the day's pack and index, then removes the folder if empty.
+        Returns the number of receipts packed.
+        """
+        names = sorted(name for name in os.listdir(day_folder) if name.lower().endswith(".pdf"))
+        if not names:
+            return 0
+
+        # Receipts this day's pack already holds, according to the index
+        indexed = dict(self.db.execute("SELECT name, size FROM receipts WHERE day = ?", (day,)))
+
+        def unpacked():
+            for name in names:
+                path = os.path.join(day_folder, name)
+                if indexed.get(name) == os.path.getsize(path):
+                    continue  # Packed by an earlier, interrupted run
+                with open(path, "rb") as receipt:
+                    yield name, receipt.read()
+
+        # Append and index the new receipts, then delete the loose copies
+        self.append(day, unpacked())
+        for name in names:
+            os.remove(os.path.join(day_folder, name))
+        if not os.listdir(day_folder):
+            os.rmdir(day_folder)
+        return len(names)
+
+    def reindex(self):
+        """
+        Rebuilds the index from the pack files. Returns the number of receipts indexed.
+        """
+        total = 0
+        with self.db:
+            self.db.execute("DELETE FROM receipts")
+            for pack_name in sorted(os.listdir(self.path)):
+                if not pack_name.endswith(".pack"):
+                    continue
+                day = pack_name[:-len(".pack")]
+                entries = [(invoice_number_from_name(name), name, day, offset, size)
+                           for name, offset, size in pack_entries(os.path.join(self.path, pack_name))]
+                # Later copies of a rewritten receipt replace earlier ones
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO receipts (invoice_number, name, day, offset, size) VALUES (?, ?, ?, ?, ?)",
+                    entries,
+                )
+                total += len(entries)
+        return total
+
+    def pack(self, receipts_dir=RECEIPTS_DIR, before=None, progress=None):
+        """
+        Packs every Receipts/<yyyy-mm-dd>/ folder for days before the given yyyy-mm-dd (default: today).
+        Returns the total number of receipts packed.
+        """
+        before = before or date.today().isoformat()
+        total = 0
+        if not os.path.isdir(receipts_dir):
+            return 0
+        for day in sorted(os.listdir(receipts_dir)):
+            day_folder = os.path.join(receipts_dir, day)
+            if not os.path.isdir(day_folder) or day >= before:
+                continue
+            try:
+                date.fromisoformat(day)
+            except ValueError:
+                continue  # Not a receipts day folder
+            count = self.pack_day(day_folder, day)
+            total += count
+            if progress and count:
+                progress(day, count)
+        return total
+
+    def find(self, invoice_number):
+        """
+        Returns (day, name, offset, size) for an archived invoice number, or None.
+        """
+        return self.db.execute(
+            "SELECT day, name, offset, size FROM receipts WHERE invoice_number = ? LIMIT 1", (invoice_number,)
+        ).fetchone()
+
+    def read(self, invoice_number):
+        """
+        Returns the archived PDF bytes for an invoice number, or None if it is not archived.
+        """
+        entry = self.find(invoice_number)
+        if entry is None:
+            return None
+        day, _, offset, size = entry
+        with open(self.pack_path(day), "rb") as f:
+            f.seek(offset)
+            return f.read(size)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pack daily receipt folders into indexed archives.")
+    parser.add_argument("--archive", default=ARCHIVE_DIR, help="archive folder (default: Archive)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    pack = commands.add_parser("pack", help="pack closed days into Archive/<yyyy-mm-dd>.pack")
+    pack.add_argument("--receipts", default=RECEIPTS_DIR, help="receipts folder (default: Receipts)")
+    pack.add_argument("--before", help="pack days before this yyyy-mm-dd (default: today)")
+
+    get = commands.add_parser("get", help="extract an archived receipt by invoice number")
+    get.add_argument("invoice_number")
+    get.add_argument("-o", "--output", help="output file (default: the receipt's file name)")
+
+    commands.add_parser("reindex", help="rebuild the index from the pack files")
+    args = parser.parse_args(argv)
+
+    with Archive(args.archive) as archive:
+        if args.command == "pack":
+            total = archive.pack(args.receipts, args.before,
+                                 progress=lambda day, count: print(f"{day}: {count} receipts packed"))
+            print(f"{total} receipts packed")
+            return 0
+        if args.command == "reindex":
+            print(f"{archive.reindex()} receipts indexed")
+            return 0
+
+        entry = archive.find(args.invoice_number)
+        if entry is None:
+            print(f"Invoice {args.invoice_number} is not in the archive.", file=sys.stderr)
+            return 1
+        output = args.output or entry[1]
+        with open(output, "wb") as f:
+            f.write(archive.read(args.invoice_number))
+        print(output)
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""
+Batch receipt rendering.
+
+Streams invoice records from a CSV or JSONL file and renders them over a
+process pool into the usual Receipts/<yyyy-mm-dd>/ layout.
+
+JSONL: one invoice per line, in the dict form described in render.py. Line
+items may be [description, qty, price] lists or objects with "description",
+"qty" and "price" keys.
+
+With --cache, receipts already in the render cache (see render_cache.py),
+such as those from an earlier attempt at the same run, are copied from it
+instead of being rendered again.
+
+Receipts are written atomically (see storage.FileSink). Each worker groups
+its fsyncs, FSYNC_BATCH receipts at a time: a receipt gets its final name
+once its group is synced, and the last group when the worker exits, so an
+interrupted run leaves temporary files behind, never truncated receipts.
+--fsync-batch 1 syncs every receipt on its own.
+
+Every rendered invoice is recorded in the SQLite ledger (see ledger.py), in
+transactions of LEDGER_BATCH invoices; pass --no-ledger to skip it.
+
+CSV: one line item per row with the columns
+
+    invoice_number,name,address,mobile,date,paid,description,qty,price
+
+Consecutive rows with the same invoice_number (or, when that column is empty,
+the same customer, date and paid amount) make up one invoice.
+
+Usage:
+    python batch.py invoices.jsonl --workers 8
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+from invoice_numbers import InvoiceNumbers
+from ledger import LEDGER_PATH, Ledger
+from render import InvoiceError, parse_line_item, validate_invoice, write_receipt
+from render_cache import CACHE_DIR, RenderCache
+from storage import FileSink
+import timing
+
+CSV_CUSTOMER_FIELDS = ("invoice_number", "name", "address", "mobile", "date", "paid")
+LEDGER_BATCH = 500  # Invoices per ledger transaction
+NUMBER_BLOCK = 1000  # Invoice numbers reserved at a time
+FSYNC_BATCH = 32  # Receipts per group of fsyncs in each worker
+
+_caches = {}  # Cache folder -> RenderCache, per worker process
+_sinks = {}  # (output folder, fsync batch) -> FileSink, per worker process
+
+
+def read_jsonl(path):
+    """
+    Yields (record_no, invoice) for each non-blank line of a JSONL file.
+    Lines that are not valid JSON are yielded as (record_no, error message).
+    """
+    with open(path, encoding="utf-8") as f:
+        for record_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                invoice = json.loads(line)
+                invoice["medicines"] = [parse_line_item(item) for item in invoice.get("medicines") or []]
+            except (ValueError, TypeError, AttributeError) as e:
+                yield record_no, f"Invalid JSON record: {e}"
+                continue
+            yield record_no, invoice
+
+
+def read_csv(path):
+    """
+    Yields (record_no, invoice) for each group of consecutive CSV rows; record_no is the first row's line number.
+    """
+    invoice = None
+    key = None
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            row_key = row.get("invoice_number") or tuple(row.get(field, "") for field in CSV_CUSTOMER_FIELDS)
+            if invoice is None or row_key != key:
+                if invoice is not None:
+                    yield record_no, invoice
+                record_no = reader.line_num
+                key = row_key
+                invoice = {field: row.get(field, "") for field in CSV_CUSTOMER_FIELDS}
+                invoice["medicines"] = []
+            invoice["medicines"].append((row.get("description", ""), row.get("qty", ""), row.get("price", "")))
+    if invoice is not None:
+        yield record_no, invoice
+
+
+def read_records(path, fmt=None):
+    """Picks the reader from fmt ("csv" or "jsonl") or from the file extension."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    return read_csv(path) if fmt == "csv" else read_jsonl(path)
+
+
+def _render_record(record_no, invoice, base_dir, cache_dir=None, fsync_batch=FSYNC_BATCH):
+    """
+    Worker entry point. Returns (record_no, path, error, invoice) so one bad record never stops the run;
+    invoice is the validated copy on success, for the ledger.
+    """
+    if isinstance(invoice, str):
+        return record_no, None, invoice, None
+    try:
+        with timing.receipt(invoice.get("invoice_number")):
+            invoice = validate_invoice(invoice)
+            cache = None
+            if cache_dir:
+                cache = _caches.get(cache_dir) or _caches.setdefault(cache_dir, RenderCache(cache_dir))
+            sink = _sinks.get((base_dir, fsync_batch))
+            if sink is None:
+                sink = _sinks[base_dir, fsync_batch] = FileSink(base_dir, batch_size=fsync_batch).flush_at_exit()
+            return record_no, write_receipt(invoice, base_dir, cache, sink), None, invoice
+    except InvoiceError as e:
+        return record_no, None, str(e), None
+    except Exception as e:  # Keep going on unexpected rendering errors too
+        return record_no, None, f"{type(e).__name__}: {e}", None
+
+
+def run_batch(records, workers=None, base_dir="Receipts", progress=None, max_pending=None, ledger=None,
+              cache_dir=None, fsync_batch=FSYNC_BATCH):
+    """
+    Renders (record_no, invoice) pairs over a process pool.
+
+    Records are consumed lazily; at most max_pending (default 4 per worker)
+    are in flight at once, so arbitrarily large inputs run in flat memory.
+    If ledger (a Ledger) is given, rendered invoices are recorded in it from
+    this process, LEDGER_BATCH at a time. If cache_dir is given, workers reuse
+    and fill the render cache in that folder. Workers sync receipts to disk
+    fsync_batch at a time; all are in place when run_batch returns.
+    progress, if given, is called as progress(done, failed, elapsed) after
+    every finished record. Returns (done, failures) where failures is a list
+    of (record_no, message).
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or workers * 4
+    invoice_numbers = InvoiceNumbers(block=NUMBER_BLOCK)
+
+    done = 0
+    failures = []
+    pending = set()
+    rendered = []  # (invoice, pdf path) waiting to be written to the ledger
+    started = time.perf_counter()
+
+    def collect(futures):
+        nonlocal done
+        for future in futures:
+            record_no, pdf_path, error, invoice = future.result()
+            done += 1
+            if error:
+                failures.append((record_no, error))
+            elif ledger is not None:
+                rendered.append((invoice, pdf_path))
+                if len(rendered) >= LEDGER_BATCH:
+                    ledger.record_many(rendered)
+                    rendered.clear()
+            if progress:
+                progress(done, len(failures), time.perf_counter() - started)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for record_no, invoice in records:
+            # Records without a number get one from the shared sequence so no two receipts share a file name
+            if isinstance(invoice, dict) and not invoice.get("invoice_number"):
+                invoice["invoice_number"] = invoice_numbers.allocate()
+            pending.add(pool.submit(_render_record, record_no, invoice, base_dir, cache_dir, fsync_batch))
+            if len(pending) >= max_pending:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        collect(pending)
+
+    if rendered:
+        ledger.record_many(rendered)
+    return done, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render receipts in bulk from CSV or JSONL.")
+    parser.add_argument("input", help="CSV or JSONL file with invoice records")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from file extension)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--out", default="Receipts", help="output folder (default: Receipts)")
+    parser.add_argument("--ledger", default=LEDGER_PATH, help="ledger database (default: ledger.db)")
+    parser.add_argument("--no-ledger", action="store_true", help="do not record invoices in the ledger")
+    parser.add_argument("--cache", nargs="?", const=CACHE_DIR, default=None, metavar="DIR",
+                        help="reuse and fill the render cache (default folder: render_cache)")
+    parser.add_argument("--fsync-batch", type=int, default=FSYNC_BATCH, metavar="N",
+                        help=f"receipts per group of fsyncs in each worker (default: {FSYNC_BATCH})")
+    args = parser.parse_args(argv)
+
+    last_report = [0.0]
+
+    def print_progress(done, failed, elapsed):
+        # Print a throughput line to stderr at most once per second
+        if elapsed - last_report[0] < 1.0:
+            return
+        last_report[0] = elapsed
+        print(f"\r{done} rendered, {failed} failed, {done / elapsed:.1f} receipts/sec",
+              end="", file=sys.stderr, flush=True)
+
+    ledger = None if args.no_ledger else Ledger(args.ledger)
+    started = time.perf_counter()
+    try:
+        done, failures = run_batch(read_records(args.input, args.format), args.workers, args.out,
+                                   progress=print_progress, ledger=ledger, cache_dir=args.cache,
+                                   fsync_batch=args.fsync_batch)
+    finally:
+        if ledger is not None:
+            ledger.close()
+    elapsed = time.perf_counter() - started
+
+    print(file=sys.stderr)
+    for record_no, error in failures:
+        print(f"Record {record_no}: {error}", file=sys.stderr)
+    rate = done / elapsed if elapsed else 0.0
+    print(f"{done - len(failures)} of {done} receipts written in {elapsed:.1f}s ({rate:.1f} receipts/sec)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,373 @@
+"""
+Benchmark suite for the receipt renderer, its layout helpers and the GUI table.
+
+Runs headless. Each benchmark is timed several times and the median is
+kept (lower is better for every metric). Results are written to JSON and,
+when a baseline file exists, compared against it: any benchmark slower
+than the baseline by more than the threshold is reported and the run
+exits with status 1. Streaming memory is checked against fixed limits,
+baseline or not: the peak RSS of streaming a 100,000 line invoice must stay
+under --max-rss, and may exceed the peak for 1,000 lines by no more than
+--max-rss-growth. The growth covers the duplicate-description check, which
+keeps every description seen (about 100 bytes a line); pages, layout and
+output must not accumulate.
+
+Usage:
+    python bench.py --save-baseline          # record bench_baseline.json on this machine
+    python bench.py                          # run and compare against it
+    python bench.py --threshold 0.1 --only render
+    python bench.py --only stream --max-rss 40 --max-rss-growth 16
+
+The Treeview benchmark imports the GUI and needs a display (for example
+under xvfb-run); without one it is skipped.
+"""
+from datetime import datetime
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import fpdf
+
+import fonts
+import render
+from batch import run_batch
+from render import build_receipt, number_to_words, pdf_bytes, validate_invoice
+from storage import FileSink
+
+BASELINE_PATH = "bench_baseline.json"
+RESULTS_PATH = "bench_results.json"
+THRESHOLD = 0.20  # Allowed slowdown against the baseline (0.20 = 20%)
+STREAM_RSS_LIMIT_MB = 48  # Ceiling for stream_100000_rss; 38.8 MB measured
+STREAM_RSS_GROWTH_LIMIT_MB = 20  # stream_100000_rss over stream_1000_rss; 15.1 MB measured (23.7 -> 38.8)
+
+
+def dummy_invoice(count, invoice_number="INVBENCH"):
+    """
+    A validated invoice with count line items, like the GUI's "Generate Dummy Data".
+    """
+    rng = random.Random(count)
+    return validate_invoice({
+        "name": "Benchmark Customer",
+        "address": "166/5 Matikata MP Check Post, Dhaka Cantonment",
+        "mobile": "01700000000",
+        "paid": "0",
+        "date": "15/09/2024",
+        "invoice_number": invoice_number,
+        "medicines": [
+            (f"Medicine {i}", rng.randint(1, 10), round(rng.uniform(50.0, 500.0), 2))
+            for i in range(1, count + 1)
+        ],
+    })
+
+
+def measure(run, repeat):
+    """
+    Calls run() repeat times and returns {"seconds": median, "min": fastest, "repeat": repeat}.
+    """
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - started)
+    return {"seconds": statistics.median(times), "min": min(times), "repeat": repeat}
+
+
+# Benchmarks: each returns a result dict, or None when it cannot run here
+def bench_render(count, repeat):
+    invoice = dummy_invoice(count)
+    return measure(lambda: pdf_bytes(build_receipt(invoice)), repeat)
+
+
+def bench_wrap_lines():
+    """get_multi_cell_lines over 1,000 distinct descriptions with a cold wrap cache."""
+    pdf = render.ReceiptPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=10)
+    width = 0.45 * (pdf.w - 2 * pdf.l_margin)
+    descriptions = [f"Medicine {i} " + "extended release tablet " * (i % 6) for i in range(1000)]
+
+    def run():
+        render._wrap_cache.clear()
+        for description in descriptions:
+            pdf.get_multi_cell_lines(width, 10, description)
+
+    return measure(run, 5)
+
+
+def bench_number_to_words():
+    return measure(lambda: [number_to_words(n) for n in range(0, 1000000, 7)], 3)
+
+
+def bench_output_file(tmp_dir):
+    """pdf.output() to a file for a 1,000 line receipt (layout excluded)."""
+    invoice = dummy_invoice(1000)
+    path = os.path.join(tmp_dir, "output.pdf")
+    times = []
+    for _ in range(5):
+        pdf = build_receipt(invoice)
+        started = time.perf_counter()
+        pdf.output(path)
+        times.append(time.perf_counter() - started)
+    return {"seconds": statistics.median(times), "min": min(times), "repeat": len(times)}
+
+
+def bench_store(tmp_dir, batch_size, count=500):
+    """Seconds per receipt to store a 20-line receipt through FileSink, one fsync each or in groups."""
+    data = pdf_bytes(build_receipt(dummy_invoice(20)))
+    folder = os.path.join(tmp_dir, f"store_{batch_size}")
+
+    def run():
+        sink = FileSink(folder, batch_size=batch_size)
+        for i in range(count):
+            sink.write(os.path.join(f"2024-01-{i % 28 + 1:02d}", f"receipt_{i}.pdf"), data)
+        sink.close()
+
+    result = measure(run, 3)
+    result["seconds"] /= count
+    result["min"] /= count
+    return result
+
+
+def bench_batch(tmp_dir, count=200):
+    """Seconds per receipt for a run_batch of 20-line invoices over all CPUs."""
+    records = [(i, dummy_invoice(20, f"INVBENCH-{i}")) for i in range(1, count + 1)]
+
+    def run():
+        done, failures = run_batch(iter(records), base_dir=os.path.join(tmp_dir, "batch"))
+        if failures:
+            raise RuntimeError(f"batch benchmark failed: {failures[0]}")
+
+    result = measure(run, 3)
+    result["seconds"] /= count
+    result["min"] /= count
+    return result
+
+
+def bench_pdf_size():
+    """
+    Total bytes of the benchmark invoice set (1, 20, 100 and 1,000 lines) in the optimized and plain output profiles.
+    """
+    invoices = [dummy_invoice(count) for count in (1, 20, 100, 1000)]
+    sizes = {}
+    previous = render.OPTIMIZE_OUTPUT
+    try:
+        for optimize in (False, True):
+            render.OPTIMIZE_OUTPUT = optimize
+            started = time.perf_counter()
+            sizes[optimize] = sum(len(pdf_bytes(build_receipt(invoice))) for invoice in invoices)
+            elapsed = time.perf_counter() - started
+    finally:
+        render.OPTIMIZE_OUTPUT = previous
+    return {"seconds": elapsed, "bytes": sizes[True], "plain_bytes": sizes[False], "repeat": 1}
+
+
+def bench_unicode_font(tmp_dir, cache):
+    """
+    A 20 line receipt with Bangla text in the Unicode font. cache is "none" (caches emptied before
+    every render), "disk" (only font_cache/ kept, like a new process) or "memory". Needs the font installed.
+    """
+    if fonts.unicode_font_path() is None:
+        return None
+    invoice = dummy_invoice(20)
+    invoice["name"] = "\u09b0\u09b9\u09bf\u09ae \u0989\u09a6\u09cd\u09a6\u09bf\u09a8"  # Rahim Uddin
+    invoice["medicines"] = [(f"{description} \u09a8\u09be\u09aa\u09be", qty, price)
+                            for description, qty, price in invoice["medicines"]]
+    cache_dir = os.path.join(tmp_dir, f"font_cache_{cache}")
+    previous = fonts.FONT_CACHE_DIR
+    fonts.FONT_CACHE_DIR = cache_dir
+
+    def run():
+        if cache == "none":
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        if cache != "memory":
+            fonts.clear_cache()
+        pdf_bytes(build_receipt(invoice))
+
+    try:
+        run()  # Fill the caches
+        return measure(run, 10)
+    finally:
+        fonts.FONT_CACHE_DIR = previous
+
+
+def bench_stream_rss(count=100000):
+    """
+    Peak RSS in MB of streaming a count-line invoice to disk, measured in a fresh interpreter. Linux only.
+
+    The child reports its own VmHWM (the high-water mark of its address space, which starts
+    afresh at exec) rather than ru_maxrss, which Linux carries over from the forked copy of
+    this process and so would report the benchmark suite's peak instead of the stream's.
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    code = (
+        "import tempfile\n"
+        "from render import stream_receipt, validate_customer\n"
+        f"invoice = validate_customer({{'name': 'Bench', 'mobile': '1', 'paid': '0', 'date': '15/09/2024',"
+        f" 'invoice_number': 'INVBENCH', 'medicines': ((f'Medicine {{i}}', 1, 1.5) for i in range({count}))}})\n"
+        "with tempfile.TemporaryFile() as f:\n"
+        "    stream_receipt(invoice, f)\n"
+        "print(next(line.split()[1] for line in open('/proc/self/status') if line.startswith('VmHWM:')))\n"
+    )
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout  # Where render.py is
+    elapsed = time.perf_counter() - started
+    kilobytes = int(output.split()[-1])  # VmHWM is in kB
+    return {"seconds": elapsed, "peak_rss_mb": kilobytes / 1024, "repeat": 1}
+
+
+def bench_treeview(count=10000):
+    """
+    update_medicine_list after replacing the list with count items. Needs a display.
+    """
+    if not os.environ.get("DISPLAY") and sys.platform.startswith("linux"):
+        return None
+    try:
+        import receipt  # Builds the main window on import
+    except Exception:  # No usable display or Tk
+        return None
+    from line_items import LineItems
+
+    receipt.medicines = LineItems(dummy_invoice(count)["medicines"])
+    result = measure(lambda: (receipt.update_medicine_list(receipt.medicines), receipt.app.update_idletasks()), 10)
+    receipt.app.destroy()
+    return result
+
+
+def run_benchmarks(only=None):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmarks = [
+            ("render_1", lambda: bench_render(1, 20)),
+            ("render_20", lambda: bench_render(20, 20)),
+            ("render_1000", lambda: bench_render(1000, 5)),
+            ("render_10000", lambda: bench_render(10000, 3)),
+            ("get_multi_cell_lines_1000", bench_wrap_lines),
+            ("number_to_words_142858", bench_number_to_words),
+            ("output_file_1000", lambda: bench_output_file(tmp_dir)),
+            ("pdf_size_set", bench_pdf_size),
+            ("unicode_font_uncached", lambda: bench_unicode_font(tmp_dir, "none")),
+            ("unicode_font_disk_cache", lambda: bench_unicode_font(tmp_dir, "disk")),
+            ("unicode_font_cached", lambda: bench_unicode_font(tmp_dir, "memory")),
+            ("store_fsync_each", lambda: bench_store(tmp_dir, None)),
+            ("store_fsync_batch_32", lambda: bench_store(tmp_dir, 32)),
+            ("batch_per_receipt", lambda: bench_batch(tmp_dir)),
+            ("stream_1000_rss", lambda: bench_stream_rss(1000)),
+            ("stream_100000_rss", bench_stream_rss),
+            ("treeview_refresh_10000", bench_treeview),
+        ]
+        results = {}
+        for name, bench in benchmarks:
+            if only and not any(pattern in name for pattern in only):
+                continue
+            print(f"{name} ...", end=" ", file=sys.stderr, flush=True)
+            result = bench()
+            if result is None:
+                print("skipped", file=sys.stderr)
+                continue
+            results[name] = result
+            extra = f", peak RSS {result['peak_rss_mb']:.1f} MB" if "peak_rss_mb" in result else ""
+            if "bytes" in result:
+                extra = f", {result['bytes']} bytes ({result['plain_bytes']} plain)"
+            print(f"{result['seconds'] * 1000:.2f} ms{extra}", file=sys.stderr)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns (name, metric, baseline value, current value) for every metric more than threshold worse than the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("seconds", "peak_rss_mb", "bytes"):
+            if metric in result and metric in previous and result[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], result[metric]))
+    return regressions
+
+
+def check_stream_rss(results, limit_mb, growth_mb):
+    """
+    Reports whether the 100,000 line stream peaked above limit_mb of RSS, or
+    above the 1,000 line stream by more than growth_mb. Returns True if it did.
+    """
+    over_limit = False
+    large = results.get("stream_100000_rss")
+    small = results.get("stream_1000_rss")
+    if limit_mb and large:
+        if large["peak_rss_mb"] > limit_mb:
+            print(f"OVER LIMIT stream_100000_rss peak_rss_mb: {large['peak_rss_mb']:.1f} > {limit_mb:g}")
+            over_limit = True
+        else:
+            print(f"stream_100000_rss peak RSS {large['peak_rss_mb']:.1f} MB, within {limit_mb:g} MB")
+    if growth_mb and large and small:
+        growth = large["peak_rss_mb"] - small["peak_rss_mb"]
+        if growth > growth_mb:
+            print(f"OVER LIMIT stream RSS growth from 1,000 to 100,000 lines: {growth:.1f} MB > {growth_mb:g}")
+            over_limit = True
+        else:
+            print(f"stream RSS growth from 1,000 to 100,000 lines {growth:.1f} MB, within {growth_mb:g} MB")
+    return over_limit
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rendering, layout and GUI hot paths.")
+    parser.add_argument("--out", default=RESULTS_PATH, help="results file (default: bench_results.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file (default: bench_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="allowed slowdown as a fraction (default: 0.20)")
+    parser.add_argument("--only", nargs="+", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--max-rss", type=float, default=STREAM_RSS_LIMIT_MB, metavar="MB",
+                        help=f"fail if streaming 100,000 lines peaks above this RSS (default: {STREAM_RSS_LIMIT_MB}, 0 to skip)")
+    parser.add_argument("--max-rss-growth", type=float, default=STREAM_RSS_GROWTH_LIMIT_MB, metavar="MB",
+                        help="fail if streaming 100,000 lines peaks this much above 1,000 lines "
+                             f"(default: {STREAM_RSS_GROWTH_LIMIT_MB}, 0 to skip)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "fpdf": getattr(fpdf, "__version__", getattr(fpdf, "FPDF_VERSION", "unknown")),
+            "cpus": os.cpu_count(),
+        },
+        "results": run_benchmarks(args.only),
+    }
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    over_limit = check_stream_rss(report["results"], args.max_rss, args.max_rss_growth)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 1 if over_limit else 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 1 if over_limit else 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(report["results"], baseline, args.threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name} {metric}: {before:.6g} -> {after:.6g} ({(after / before - 1) * 100:+.0f}%)")
+    if not regressions:
+        print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+    return 1 if regressions or over_limit else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
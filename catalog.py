@@ -0,0 +1,79 @@
+"""
+Medicine catalog with prefix lookup.
+
+The catalog is a CSV file with "description" and "price" columns (one row
+per SKU). It is loaded into two parallel arrays sorted by the case-folded
+description, so a prefix search is a bisect plus a short forward scan:
+O(log n + results), well under a millisecond for a 40k SKU formulary.
+"""
+from bisect import bisect_left
+import csv
+import os
+import threading
+
+CATALOG_PATH = "catalog.csv"
+
+
+class Catalog:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self.keys = []  # Case-folded descriptions, sorted
+        self.names = []  # Descriptions as written in the catalog, same order as keys
+        self.prices = []  # Prices, same order as keys
+        self.loaded = False
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads and indexes the catalog file. Safe to call more than once or from a background thread.
+        A missing file leaves the catalog empty.
+        """
+        with self.lock:
+            if self.loaded:
+                return
+            rows = {}
+            if os.path.exists(self.path):
+                with open(self.path, newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        description = (row.get("description") or "").strip()
+                        try:
+                            price = float(row.get("price") or "")
+                        except ValueError:
+                            continue  # Skip rows without a usable price
+                        if description:
+                            rows[description.casefold()] = (description, price)
+            entries = sorted(rows.items())
+            self.keys = [key for key, _ in entries]
+            self.names = [name for _, (name, _) in entries]
+            self.prices = [price for _, (_, price) in entries]
+            self.loaded = True
+
+    def load_in_background(self):
+        threading.Thread(target=self.load, daemon=True).start()
+
+    def suggest(self, prefix, limit=10):
+        """
+        Returns up to limit (description, price) pairs whose description starts with prefix
+        (case-insensitive), in alphabetical order. Returns [] until the catalog is loaded.
+        """
+        prefix = prefix.strip().casefold()
+        if not prefix or not self.loaded:
+            return []
+        results = []
+        i = bisect_left(self.keys, prefix)
+        while i < len(self.keys) and len(results) < limit and self.keys[i].startswith(prefix):
+            results.append((self.names[i], self.prices[i]))
+            i += 1
+        return results
+
+    def price(self, description):
+        """
+        Returns the catalog price for an exact (case-insensitive) description, or None.
+        """
+        if not self.loaded:
+            return None
+        key = description.strip().casefold()
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return self.prices[i]
+        return None
@@ -0,0 +1,168 @@
+"""
+ESC/POS receipts for thermal printers.
+
+Renders a validated invoice (see render.validate_invoice) straight into the
+raw byte stream a 58 mm or 80 mm ESC/POS receipt printer understands, so a
+counter receipt comes out of the printer without building a PDF or opening
+a viewer. The totals and the amount in words come from the same code as the
+PDF receipt (render.calculate_totals, render.number_to_words).
+
+The stream is written with one write to a device path: a printer device
+(/dev/usb/lp0, /dev/ttyUSB0), a shared printer on Windows
+(\\\\localhost\\Thermal), or any file, which is handy for checking the
+output. Text is printed in the printer's PC437 code page; characters it
+cannot print (Bangla, the Taka sign) come out as "?".
+
+Usage:
+    python escpos.py invoice.json --device /dev/usb/lp0 --width 58
+"""
+import argparse
+import json
+import sys
+import textwrap
+
+from render import InvoiceError, calculate_totals, number_to_words, parse_line_item, validate_invoice
+
+# Characters per line in the printer's standard font (font A, 12x24 dots)
+LINE_WIDTHS = {58: 32, 80: 48}
+
+CODE_PAGE = "cp437"
+
+# ESC/POS commands
+INIT = b"\x1b@"
+SELECT_CODE_PAGE = b"\x1bt\x00"  # PC437
+ALIGN_LEFT = b"\x1ba\x00"
+ALIGN_CENTER = b"\x1ba\x01"
+BOLD_ON = b"\x1bE\x01"
+BOLD_OFF = b"\x1bE\x00"
+DOUBLE_SIZE = b"\x1d!\x11"  # Double width and height
+NORMAL_SIZE = b"\x1d!\x00"
+FEED_AND_CUT = b"\x1dVB\x03"  # Feed 3 lines, then a partial cut
+
+SHOP_NAME = "MAA MEDICAL CENTER"
+SHOP_DETAILS = [
+    "Drugs, Operation Disposables, CT, MRI, ANGIOGRAM, PET CT Contrast, Medicine Supplier",
+    "166/5 Matikata MP Check Post, Dhaka Cantonment, Dhaka-1206",
+]
+
+
+class TicketWriter:
+    """
+    Collects text lines and ESC/POS commands into one byte string.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self.parts = [INIT, SELECT_CODE_PAGE]
+
+    def command(self, *commands):
+        self.parts.extend(commands)
+
+    def line(self, text=""):
+        self.parts.append(text.encode(CODE_PAGE, errors="replace") + b"\n")
+
+    def wrapped(self, text, indent=""):
+        for line in textwrap.wrap(text, self.width, subsequent_indent=indent) or [""]:
+            self.line(line)
+
+    def columns(self, left, right):
+        """A line with left aligned text and right aligned text, the left side cut short if needed."""
+        room = self.width - len(right) - 1
+        self.line(f"{left[:room]:<{room}} {right}")
+
+    def rule(self, char="-"):
+        self.line(char * self.width)
+
+    def getvalue(self):
+        return b"".join(self.parts)
+
+
+def ticket_bytes(invoice, paper_width=80):
+    """
+    Returns the ESC/POS byte stream for a validated invoice on 58 or 80 mm paper.
+    """
+    try:
+        width = LINE_WIDTHS[paper_width]
+    except KeyError:
+        raise InvoiceError(f"Paper width must be one of {', '.join(map(str, LINE_WIDTHS))} mm.")
+    ticket = TicketWriter(width)
+
+    # Header
+    ticket.command(ALIGN_CENTER, BOLD_ON, DOUBLE_SIZE)
+    for line in textwrap.wrap(SHOP_NAME, width // 2):  # Double width halves the characters per line
+        ticket.line(line)
+    ticket.command(NORMAL_SIZE, BOLD_OFF)
+    for details in SHOP_DETAILS:
+        ticket.wrapped(details)
+    ticket.command(ALIGN_LEFT)
+    ticket.rule("=")
+
+    # Invoice and customer details
+    ticket.line(f"Invoice: {invoice['invoice_number']}")
+    ticket.line(f"Date: {invoice['date']}")
+    ticket.wrapped(f"Name: {invoice['name']}", "  ")
+    if invoice["address"]:
+        ticket.wrapped(f"Address: {invoice['address']}", "  ")
+    ticket.line(f"Mobile No: {invoice['mobile']}")
+    ticket.rule()
+
+    # Line items: the description on its own lines, then quantity x price and the amount
+    for idx, (description, qty, price) in enumerate(invoice["medicines"], 1):
+        ticket.wrapped(f"{idx}. {description}", "   ")
+        ticket.columns(f"   {qty} x {price:.2f}", f"{qty * price:.2f}")
+    ticket.rule()
+
+    # Totals
+    total_amount, due = calculate_totals(invoice["medicines"], invoice["paid"])
+    ticket.command(BOLD_ON)
+    ticket.columns("Total", f"{total_amount:.2f}")
+    ticket.command(BOLD_OFF)
+    ticket.columns("Paid", f"{invoice['paid']:.2f}")
+    ticket.command(BOLD_ON)
+    ticket.columns("Due", f"{due:.2f}")
+    ticket.command(BOLD_OFF)
+    ticket.wrapped(f"Taka (in Words): {number_to_words(int(total_amount))} Taka Only.")
+    ticket.rule("=")
+
+    # Footer
+    ticket.command(ALIGN_CENTER)
+    ticket.line("Sold Items Not Taken")
+    ticket.line("Thank You")
+    ticket.command(ALIGN_LEFT, FEED_AND_CUT)
+    return ticket.getvalue()
+
+
+def print_ticket(invoice, device, paper_width=80):
+    """
+    Writes the ESC/POS stream for a validated invoice to a printer device or file in one write.
+    """
+    data = ticket_bytes(invoice, paper_width)
+    with open(device, "wb") as f:
+        f.write(data)
+    return len(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print a receipt on an ESC/POS thermal printer.")
+    parser.add_argument("invoice", help="invoice JSON file (the batch.py JSONL record form), - for stdin")
+    parser.add_argument("--device", required=True, help="printer device, shared printer path or output file")
+    parser.add_argument("--width", type=int, default=80, choices=sorted(LINE_WIDTHS), help="paper width in mm")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.invoice == "-":
+            invoice = json.load(sys.stdin)
+        else:
+            with open(args.invoice, encoding="utf-8") as f:
+                invoice = json.load(f)
+        invoice["medicines"] = [parse_line_item(item) for item in invoice.get("medicines") or []]
+        size = print_ticket(validate_invoice(invoice), args.device, args.width)
+    except (OSError, ValueError, TypeError, AttributeError) as e:  # InvoiceError is a ValueError
+        print(f"Could not print receipt: {e}", file=sys.stderr)
+        return 1
+    print(f"{size} bytes sent to {args.device}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
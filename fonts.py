@@ -0,0 +1,255 @@
+"""
+Unicode TrueType fonts for receipts, with cached parsing.
+
+Receipts are printed in the core Arial font, which only covers Latin-1.
+Text that needs more (Bangla names, addresses and medicines) is printed in
+a TrueType font embedded in the PDF, the first file in UNICODE_FONT_FILES
+that exists for the style.
+
+Embedding a TrueType font costs twice per document with plain FPDF: the
+metrics (cmap and widths) are parsed or unpickled in add_font, and the
+used glyphs are cut out of the font file again when the document is
+written. Both are cached here:
+
+- font_metrics() keeps the parsed metrics per process and saves them as
+  JSON under font_cache/, keyed by the font file's size and modification time, so only
+  the first process after a font change parses the file.
+- CachedTTFontFile keeps the subset fonts FPDF embeds, keyed by font file
+  and character set, per process and under font_cache/subsets/, so a
+  receipt with the same characters as an earlier one (in any process)
+  reuses its subset.
+
+The disk caches are JSON rather than pickle, so a tampered cache file can
+at worst spoil a receipt's font, never run code.
+
+Importing this module makes FPDF build its subsets with CachedTTFontFile
+and compute TrueType table checksums with struct instead of a Python loop;
+both produce byte-identical fonts.
+"""
+from collections import OrderedDict
+import base64
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+
+from fpdf import fpdf as fpdf_module
+from fpdf import ttfonts
+
+from resources import resource_path
+from storage import write_atomic
+
+FONT_CACHE_DIR = "font_cache"
+SUBSET_CACHE_SIZE = 256  # Subset fonts kept in memory per process
+
+UNICODE_FAMILY = "unicode"
+
+# TrueType files by style, first existing one wins. The font must have Latin
+# glyphs too, since a line with any Bangla in it is printed in this font.
+# The fonts folder ships with the app (see resources.py and receipt.spec).
+UNICODE_FONT_FILES = {
+    "": [
+        resource_path(os.path.join("fonts", "NotoSansBengali-Regular.ttf")),
+        "C:/Windows/Fonts/Nirmala.ttf",
+        "/usr/share/fonts/truetype/noto/NotoSansBengali-Regular.ttf",
+    ],
+    "B": [
+        resource_path(os.path.join("fonts", "NotoSansBengali-Bold.ttf")),
+        "C:/Windows/Fonts/NirmalaB.ttf",
+        "/usr/share/fonts/truetype/noto/NotoSansBengali-Bold.ttf",
+    ],
+}
+
+_metrics_cache = {}  # (path, size, mtime) -> parsed metrics
+_subset_cache = OrderedDict()  # Subset key -> (font stream, code to glyph map, max code point), in LRU order
+_lock = threading.Lock()
+
+
+def needs_unicode_font(text):
+    """
+    True when text has characters the core fonts cannot print (anything outside Latin-1).
+    """
+    if text.isascii():
+        return False
+    try:
+        text.encode("latin-1")
+    except UnicodeEncodeError:
+        return True
+    return False
+
+
+def unicode_font_path(style=""):
+    """
+    Returns the TrueType file to use for style, or None when none is installed.
+    Italic falls back to the regular face, bold italic to bold.
+    """
+    style = style.replace("I", "")
+    for path in UNICODE_FONT_FILES.get(style) or UNICODE_FONT_FILES[""]:
+        if os.path.exists(path):
+            return path
+    if style:
+        return unicode_font_path("")
+    return None
+
+
+def font_signature(path):
+    st = os.stat(path)
+    return path, st.st_size, st.st_mtime_ns
+
+
+def font_metrics(path):
+    """
+    Returns the metrics FPDF's add_font(uni=True) would parse from path, from memory, disk or the font file.
+    """
+    signature = font_signature(path)
+    metrics = _metrics_cache.get(signature)
+    if metrics is not None:
+        return metrics
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    cache_path = os.path.join(FONT_CACHE_DIR, f"{stem}-{signature[1]}-{signature[2]}.json")
+    try:
+        with open(cache_path, "rb") as f:
+            metrics = json.load(f)
+    except (OSError, ValueError):
+        metrics = parse_metrics(path)
+        save_cache_file(cache_path, json.dumps(metrics, separators=(",", ":")).encode("ascii"))
+    _metrics_cache[signature] = metrics
+    return metrics
+
+
+def preload():
+    """
+    Loads the metrics of the installed Unicode fonts into this process (used to warm up workers).
+    """
+    for style in ("", "B"):
+        path = unicode_font_path(style)
+        if path:
+            font_metrics(path)
+
+
+def clear_cache():
+    """
+    Empties this process's metrics and subset caches; the disk cache is kept.
+    """
+    with _lock:
+        _metrics_cache.clear()
+        _subset_cache.clear()
+
+
+def parse_metrics(path):
+    """
+    Parses a TrueType file into the same metrics dict as FPDF's add_font(uni=True).
+    """
+    ttf = ttfonts.TTFontFile()
+    ttf.getMetrics(path)
+    return {
+        "name": re.sub("[ ()]", "", ttf.fullName),
+        "type": "TTF",
+        "desc": {
+            "Ascent": int(round(ttf.ascent, 0)),
+            "Descent": int(round(ttf.descent, 0)),
+            "CapHeight": int(round(ttf.capHeight, 0)),
+            "Flags": ttf.flags,
+            "FontBBox": "[%s %s %s %s]" % tuple(int(round(value, 0)) for value in ttf.bbox),
+            "ItalicAngle": int(ttf.italicAngle),
+            "StemV": int(round(ttf.stemV, 0)),
+            "MissingWidth": int(round(ttf.defaultWidth, 0)),
+        },
+        "up": round(ttf.underlinePosition),
+        "ut": round(ttf.underlineThickness),
+        "originalsize": os.stat(path).st_size,
+        "cw": ttf.charWidths,
+    }
+
+
+def add_unicode_font(pdf, family, style, path):
+    """
+    Registers path as family/style in pdf, like pdf.add_font(family, style, path, uni=True) but from the metrics cache.
+    """
+    fontkey = family + style
+    if fontkey in pdf.fonts:
+        return
+    metrics = font_metrics(path)
+    # Same registration as FPDF's add_font; characters below 32 (57 with page number aliases) are always in the subset
+    subset = list(range(0, 57)) if hasattr(pdf, "str_alias_nb_pages") else list(range(0, 32))
+    pdf.fonts[fontkey] = {
+        "i": len(pdf.fonts) + 1, "type": "TTF",
+        "name": metrics["name"], "desc": metrics["desc"],
+        "up": metrics["up"], "ut": metrics["ut"],
+        "cw": metrics["cw"],
+        "ttffile": path, "fontkey": fontkey,
+        "subset": subset, "unifilename": None,
+    }
+    pdf.font_files[fontkey] = {"length1": metrics["originalsize"], "type": "TTF", "ttffile": path}
+    pdf.font_files[path] = {"type": "TTF"}
+
+
+def checksum(data):
+    """
+    TrueType table checksum (sum of big-endian 32-bit words) as the (high, low) 16-bit pair FPDF expects.
+    """
+    if len(data) % 4:
+        data += b"\0" * (4 - len(data) % 4)
+    total = sum(struct.unpack(f">{len(data) // 4}L", data)) & 0xFFFFFFFF
+    return total >> 16, total & 0xFFFF
+
+
+class CachedTTFontFile(ttfonts.TTFontFile):
+    """
+    FPDF's subsetter with the finished subsets cached in memory and on disk.
+    """
+
+    def makeSubset(self, file, subset):
+        signature = font_signature(file)
+        characters = sorted(set(subset))
+        key = hashlib.sha256(repr((signature[1:], os.path.abspath(file), characters)).encode("utf-8")).hexdigest()
+
+        with _lock:
+            cached = _subset_cache.get(key)
+            if cached is not None:
+                _subset_cache.move_to_end(key)
+        if cached is None:
+            cache_path = os.path.join(FONT_CACHE_DIR, "subsets", key[:2], f"{key}.json")
+            try:
+                with open(cache_path, "rb") as f:
+                    cached = load_subset(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError):
+                stream = super().makeSubset(file, subset)
+                cached = (stream, self.codeToGlyph, self.maxUni)
+                save_cache_file(cache_path, dump_subset(cached))
+            with _lock:
+                _subset_cache[key] = cached
+                if len(_subset_cache) > SUBSET_CACHE_SIZE:
+                    _subset_cache.popitem(last=False)
+
+        stream, self.codeToGlyph, self.maxUni = cached
+        return stream
+
+
+def dump_subset(cached):
+    stream, code_to_glyph, max_uni = cached
+    return json.dumps({
+        "stream": base64.b64encode(stream).decode("ascii"),
+        "code_to_glyph": sorted(code_to_glyph.items()),
+        "max_uni": max_uni,
+    }, separators=(",", ":")).encode("ascii")
+
+
+def load_subset(entry):
+    code_to_glyph = {int(code): int(glyph) for code, glyph in entry["code_to_glyph"]}
+    return base64.b64decode(entry["stream"], validate=True), code_to_glyph, int(entry["max_uni"])
+
+
+def save_cache_file(path, data):
+    try:
+        write_atomic(path, data, sync=False)  # A cache file lost in a crash is parsed again
+    except OSError:
+        pass  # A read-only cache only costs speed
+
+
+# FPDF looks both up by module global name when writing fonts
+fpdf_module.TTFontFile = CachedTTFontFile
+ttfonts.calcChecksum = checksum
@@ -0,0 +1,73 @@
+"""
+Invoice number allocation.
+
+Numbers look like INV20240915-000042: the allocation date followed by a
+per-day sequence. The sequence lives in a small SQLite file shared by every
+process on the machine; an allocator reserves a block of numbers per
+transaction (BEGIN IMMEDIATE, so concurrent reservations serialize) and
+hands them out from memory, so numbers are unique across threads and
+processes and increase monotonically within each allocator.
+
+Unused numbers in a block are skipped when the process exits, so block
+sizes above 1 trade gap-free numbering for throughput: the GUI uses
+block=1, batch runs reserve larger blocks.
+"""
+from datetime import datetime
+import os
+import sqlite3
+import threading
+
+NUMBERS_PATH = "invoice_numbers.db"
+
+
+class InvoiceNumbers:
+    def __init__(self, path=NUMBERS_PATH, block=1):
+        self.path = path
+        self.block = block  # Numbers reserved per database transaction
+        self.lock = threading.Lock()
+        self.db = None
+        self.pid = None  # Process that opened self.db
+        self.day = None  # yyyymmdd of the current block
+        self.next = 0  # Next number to hand out from the current block
+        self.end = 0  # First number past the current block
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS sequences (day TEXT PRIMARY KEY, next INTEGER NOT NULL)")
+        return db
+
+    def reserve(self, day):
+        """
+        Claims the next block of numbers for day in the shared sequence and returns its first number.
+        """
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute("SELECT next FROM sequences WHERE day = ?", (day,)).fetchone()
+            start = row[0] if row else 1
+            self.db.execute("INSERT OR REPLACE INTO sequences (day, next) VALUES (?, ?)", (day, start + self.block))
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return start
+
+    def allocate(self):
+        """
+        Returns a new invoice number. Safe to call from any thread.
+        """
+        with self.lock:
+            if self.pid != os.getpid():
+                # A forked child must not reuse its parent's connection or block
+                self.db = self.connect()
+                self.pid = os.getpid()
+                self.day = None
+            day = datetime.now().strftime("%Y%m%d")
+            if day != self.day or self.next >= self.end:
+                self.next = self.reserve(day)
+                self.end = self.next + self.block
+                self.day = day
+            number = self.next
+            self.next += 1
+        return f"INV{day}-{number:06d}"
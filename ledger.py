@@ -0,0 +1,252 @@
+"""
+SQLite invoice ledger.
+
+Every rendered invoice is recorded with its line items in ledger.db, so past
+receipts can be looked up by invoice number, date, customer name or mobile
+number and re-rendered from the stored data instead of hunting through
+Receipts/<date>/ for a file name.
+
+The database runs in WAL mode with synchronous=NORMAL: a commit is an
+append to the write-ahead log without an fsync, so recording a receipt
+costs well under a millisecond, and bulk loads go through record_many,
+which writes any number of invoices in a single transaction.
+
+Triggers keep a per-day, per-medicine rollup (daily_sales) and a partial
+index of invoices with a balance due, so sales reports (see reports.py)
+read thousands of pre-aggregated rows instead of millions of line items.
+
+Usage:
+    python ledger.py find --mobile 01712345678
+    python ledger.py reprint INV20240915-000042
+"""
+from datetime import datetime
+import argparse
+import sqlite3
+import sys
+
+from render import calculate_totals, render_to_path
+from render_cache import RenderCache
+
+LEDGER_PATH = "ledger.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    invoice_number TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL COLLATE NOCASE,
+    address TEXT NOT NULL,
+    mobile TEXT NOT NULL,
+    date TEXT NOT NULL,          -- dd/mm/yyyy, as printed on the receipt
+    folder_date TEXT NOT NULL,   -- yyyy-mm-dd, for sorting and date ranges
+    paid REAL NOT NULL,
+    total REAL NOT NULL,
+    pdf_path TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_date ON invoices (folder_date);
+CREATE INDEX IF NOT EXISTS idx_invoices_name ON invoices (name);
+CREATE INDEX IF NOT EXISTS idx_invoices_mobile ON invoices (mobile);
+-- Covers the outstanding dues report, which only looks at unpaid invoices
+CREATE INDEX IF NOT EXISTS idx_invoices_due ON invoices (mobile, name, folder_date, total, paid)
+    WHERE total - paid > 0.005;
+
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    description TEXT NOT NULL,
+    qty INTEGER NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (invoice_id, position)
+) WITHOUT ROWID;
+
+-- Line items, quantity and amount sold per medicine per day
+CREATE TABLE IF NOT EXISTS daily_sales (
+    folder_date TEXT NOT NULL,
+    description TEXT NOT NULL,
+    lines INTEGER NOT NULL,
+    qty INTEGER NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (folder_date, description)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS line_items_add_sales AFTER INSERT ON line_items BEGIN
+    INSERT INTO daily_sales (folder_date, description, lines, qty, amount)
+    SELECT folder_date, NEW.description, 1, NEW.qty, NEW.qty * NEW.price FROM invoices WHERE id = NEW.invoice_id
+    ON CONFLICT (folder_date, description) DO UPDATE
+    SET lines = lines + 1, qty = qty + excluded.qty, amount = amount + excluded.amount;
+END;
+
+-- Runs before the line items are removed by ON DELETE CASCADE
+CREATE TRIGGER IF NOT EXISTS invoices_remove_sales BEFORE DELETE ON invoices BEGIN
+    UPDATE daily_sales
+    SET lines = lines - (SELECT COUNT(*) FROM line_items
+                         WHERE invoice_id = OLD.id AND description = daily_sales.description),
+        qty = qty - (SELECT SUM(qty) FROM line_items
+                     WHERE invoice_id = OLD.id AND description = daily_sales.description),
+        amount = amount - (SELECT SUM(qty * price) FROM line_items
+                           WHERE invoice_id = OLD.id AND description = daily_sales.description)
+    WHERE folder_date = OLD.folder_date
+      AND description IN (SELECT description FROM line_items WHERE invoice_id = OLD.id);
+    DELETE FROM daily_sales WHERE folder_date = OLD.folder_date AND lines = 0;
+END;
+"""
+
+# Fills daily_sales for ledgers written before the rollup existed
+BACKFILL_DAILY_SALES = """
+INSERT INTO daily_sales (folder_date, description, lines, qty, amount)
+SELECT folder_date, description, COUNT(*), SUM(qty), SUM(qty * price)
+FROM invoices JOIN line_items ON line_items.invoice_id = invoices.id
+GROUP BY folder_date, description
+"""
+
+INVOICE_COLUMNS = "invoice_number, name, address, mobile, date, folder_date, paid, total, pdf_path, created_at"
+
+
+class Ledger:
+    def __init__(self, path=LEDGER_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+        with self.db:
+            if (self.db.execute("SELECT 1 FROM line_items LIMIT 1").fetchone()
+                    and not self.db.execute("SELECT 1 FROM daily_sales LIMIT 1").fetchone()):
+                self.db.execute(BACKFILL_DAILY_SALES)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, invoice, pdf_path=None):
+        """
+        Stores a validated invoice (see render.validate_invoice) and its line items.
+        """
+        self.record_many([(invoice, pdf_path)])
+
+    def record_many(self, entries):
+        """
+        Stores (invoice, pdf_path) pairs in one transaction. An invoice number that
+        is already in the ledger is replaced, so re-running a batch does not duplicate it.
+        """
+        created_at = datetime.now().isoformat(timespec="seconds")
+        with self.db:
+            for invoice, pdf_path in entries:
+                total_amount, _ = calculate_totals(invoice["medicines"], invoice["paid"])
+                self.db.execute("DELETE FROM invoices WHERE invoice_number = ?", (invoice["invoice_number"],))
+                invoice_id = self.db.execute(
+                    f"INSERT INTO invoices ({INVOICE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (invoice["invoice_number"], invoice["name"], invoice["address"], invoice["mobile"],
+                     invoice["date"], invoice["folder_date"], invoice["paid"], total_amount, pdf_path, created_at),
+                ).lastrowid
+                self.db.executemany(
+                    "INSERT INTO line_items (invoice_id, position, description, qty, price) VALUES (?, ?, ?, ?, ?)",
+                    ((invoice_id, position, description, qty, price)
+                     for position, (description, qty, price) in enumerate(invoice["medicines"], 1)),
+                )
+
+    def find(self, invoice_number=None, name=None, mobile=None, date_from=None, date_to=None, limit=100):
+        """
+        Returns matching invoices (without line items) as dicts, newest first.
+
+        name matches as a case-insensitive prefix; date_from and date_to are
+        inclusive yyyy-mm-dd bounds. Every filter is served by an index.
+        """
+        conditions = []
+        params = []
+        if invoice_number:
+            conditions.append("invoice_number = ?")
+            params.append(invoice_number)
+        if name:
+            # Escape LIKE wildcards so the name is matched literally
+            pattern = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("name LIKE ? ESCAPE '\\'")
+            params.append(pattern + "%")
+        if mobile:
+            conditions.append("mobile = ?")
+            params.append(mobile)
+        if date_from:
+            conditions.append("folder_date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("folder_date <= ?")
+            params.append(date_to)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.db.execute(
+            f"SELECT {INVOICE_COLUMNS} FROM invoices {where} ORDER BY folder_date DESC, id DESC LIMIT ?",
+            params + [limit],
+        )
+        return [dict(row) for row in rows]
+
+    def get(self, invoice_number):
+        """
+        Returns a stored invoice with its line items, in the dict form render.py accepts, or None.
+        """
+        row = self.db.execute(
+            f"SELECT id, {INVOICE_COLUMNS} FROM invoices WHERE invoice_number = ?", (invoice_number,)
+        ).fetchone()
+        if row is None:
+            return None
+        invoice = dict(row)
+        invoice["medicines"] = [
+            tuple(item) for item in self.db.execute(
+                "SELECT description, qty, price FROM line_items WHERE invoice_id = ? ORDER BY position",
+                (invoice.pop("id"),),
+            )
+        ]
+        return invoice
+
+    def reprint(self, invoice_number, base_dir="Receipts", cache=None):
+        """
+        Re-renders a stored invoice under base_dir/<yyyy-mm-dd>/ and returns the path.
+        With a cache, the PDF from the original render is reused when it is still there.
+        Raises KeyError if the invoice number is not in the ledger.
+        """
+        invoice = self.get(invoice_number)
+        if invoice is None:
+            raise KeyError(invoice_number)
+        return render_to_path(invoice, base_dir, cache)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up and reprint invoices from the ledger.")
+    parser.add_argument("--ledger", default=LEDGER_PATH, help="ledger database (default: ledger.db)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    find = commands.add_parser("find", help="list matching invoices")
+    find.add_argument("--number", help="invoice number")
+    find.add_argument("--name", help="customer name prefix")
+    find.add_argument("--mobile", help="mobile number")
+    find.add_argument("--from", dest="date_from", help="first date, yyyy-mm-dd")
+    find.add_argument("--to", dest="date_to", help="last date, yyyy-mm-dd")
+    find.add_argument("--limit", type=int, default=100)
+
+    reprint = commands.add_parser("reprint", help="re-render a stored invoice")
+    reprint.add_argument("invoice_number")
+    reprint.add_argument("--out", default="Receipts", help="output folder (default: Receipts)")
+    args = parser.parse_args(argv)
+
+    with Ledger(args.ledger) as ledger:
+        if args.command == "find":
+            for invoice in ledger.find(args.number, args.name, args.mobile, args.date_from, args.date_to, args.limit):
+                print(f"{invoice['invoice_number']}  {invoice['date']}  {invoice['name']}  {invoice['mobile']}  "
+                      f"{invoice['total']:.2f}")
+            return 0
+        try:
+            print(ledger.reprint(args.invoice_number, args.out, RenderCache()))
+        except KeyError:
+            print(f"Invoice {args.invoice_number} is not in the ledger.", file=sys.stderr)
+            return 1
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Bulk import of line items from a pasted block, CSV or XLSX file.
+
+Hospital orders arrive as spreadsheets. Rows are read as a stream (a
+pasted block or CSV line by line, an XLSX sheet in openpyxl's read-only
+mode) and checked in one pass with the same rules as the Add Medicine
+button: a description, a whole-number quantity, a price above zero and no
+description that is already in the table or earlier in the import. Every
+bad row is reported with its row number, and the good rows are added to a
+LineItems in one go, so thousands of lines take one table refresh.
+
+Columns are description, quantity, price in that order, unless the first
+row is a header naming them (description/medicine, qty/quantity, price),
+in which case they may be in any order with other columns in between.
+XLSX files need openpyxl (pip install openpyxl); the other sources use
+the standard library only.
+"""
+import csv
+import io
+import math
+import os
+
+HEADER_NAMES = {
+    "description": "description", "medicine": "description", "medicine details": "description",
+    "item": "description", "qty": "qty", "quantity": "qty", "price": "price", "unit price": "price",
+}
+MAX_ERRORS = 20  # Row errors listed before the rest are only counted
+
+
+class LineImportError(ValueError):
+    """Raised when a source cannot be read at all (as opposed to bad rows)."""
+
+
+def read_text(text):
+    """
+    Yields (row number, cells) from a pasted block: tab-separated (as copied from a spreadsheet) or CSV.
+    """
+    delimiter = "\t" if "\t" in text.split("\n", 1)[0] else ","
+    yield from enumerate(csv.reader(io.StringIO(text), delimiter=delimiter), 1)
+
+
+def read_csv(path, delimiter=","):
+    """
+    Yields (row number, cells) from a CSV or other delimited text file, one line at a time.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        yield from enumerate(csv.reader(f, delimiter=delimiter), 1)
+
+
+def read_xlsx(path):
+    """
+    Yields (row number, cells) from the first sheet of an XLSX workbook, one row at a time.
+    """
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise LineImportError("Importing Excel files needs openpyxl (pip install openpyxl). "
+                              "Save the sheet as CSV, or copy and paste the rows instead.")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row_no, row in enumerate(workbook.worksheets[0].iter_rows(values_only=True), 1):
+            yield row_no, ["" if value is None else value for value in row]
+    finally:
+        workbook.close()
+
+
+def read_file(path):
+    """
+    Yields (row number, cells) from a .csv, .tsv/.txt or .xlsx file.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".xlsx", ".xlsm"):
+        return read_xlsx(path)
+    if extension in (".tsv", ".txt"):
+        return read_csv(path, delimiter="\t")
+    if extension == ".csv":
+        return read_csv(path)
+    raise LineImportError(f"Cannot import {extension or 'files without an extension'}; use CSV or XLSX.")
+
+
+def header_columns(cells):
+    """
+    Returns the (description, qty, price) column indexes named by a header row, or None if cells is not a header.
+    """
+    columns = {}
+    for index, cell in enumerate(cells):
+        name = HEADER_NAMES.get(str(cell).strip().lower())
+        if name and name not in columns:
+            columns[name] = index
+    if len(columns) < 3:
+        return None
+    return columns["description"], columns["qty"], columns["price"]
+
+
+def parse_qty(value):
+    # Whole numbers of at least 0 only, like the Quantity field; spreadsheets hand over 3 as 3.0
+    if isinstance(value, float) and math.isfinite(value) and value.is_integer() and value >= 0:
+        return int(value)
+    if isinstance(value, int) and value >= 0:
+        return value
+    value = str(value).strip()
+    if not value.isdigit():
+        raise ValueError
+    return int(value)
+
+
+def parse_rows(rows, existing=()):
+    """
+    Checks (row number, cells) pairs in one pass. Returns (items, errors): the valid
+    (description, qty, price) items in order, and (row number, message) for each bad row.
+
+    Blank rows are skipped. Descriptions in existing (e.g. the LineItems being
+    imported into) or earlier in the import count as duplicates.
+    """
+    items = []
+    errors = []
+    seen = set()
+    columns = (0, 1, 2)
+    first = True
+    for row_no, cells in rows:
+        if not any(str(cell).strip() for cell in cells):
+            continue
+        if first:
+            # The first non-blank row may be a header naming the columns
+            first = False
+            header = header_columns(cells)
+            if header:
+                columns = header
+                continue
+
+        description, qty, price = (cells[index] if index < len(cells) else "" for index in columns)
+        description = str(description).strip()
+
+        if not description or str(qty).strip() == "" or str(price).strip() == "":
+            errors.append((row_no, "Medicine Details, Quantity, and Price are required fields."))
+            continue
+        try:
+            qty = parse_qty(qty)
+            price = float(price)
+            if not math.isfinite(price):
+                raise ValueError  # "nan" and "inf" parse as floats, and NaN slips past the check below
+        except ValueError:
+            errors.append((row_no, "Quantity must be an integer and Price must be a number."))
+            continue
+        if price <= 0:
+            errors.append((row_no, "Price must be greater than 0."))
+            continue
+        if description in seen or description in existing:
+            errors.append((row_no, f"{description}: This medicine description already exists."))
+            continue
+
+        seen.add(description)
+        items.append((description, qty, price))
+    return items, errors
+
+
+def format_errors(errors, limit=MAX_ERRORS):
+    """
+    Returns the row errors as "Row n: message" lines, at most limit of them plus a count of the rest.
+    """
+    lines = [f"Row {row_no}: {message}" for row_no, message in errors[:limit]]
+    if len(errors) > limit:
+        lines.append(f"... and {len(errors) - limit} more.")
+    return "\n".join(lines)
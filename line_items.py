@@ -0,0 +1,93 @@
+"""
+Indexed collection of invoice line items.
+
+LineItems keeps (description, qty, price) rows under stable row IDs (used as
+Treeview item IDs by the GUI), a description -> row ID index for duplicate
+checks, and a running total. Adding, updating and deleting a row are all
+O(1), and extend adds a bulk import in one pass. Iterating yields the rows
+in entry order as (description, qty, price) tuples, so a LineItems can be
+passed straight to ReceiptPDF.add_table.
+"""
+from itertools import islice
+
+
+class LineItems:
+    def __init__(self, items=()):
+        self.rows = {}  # Row ID -> (description, qty, price), in entry order
+        self.row_ids = {}  # Description -> row ID
+        self.total = 0.0  # Sum of qty * price over all rows
+        self.next_id = 1
+        for description, qty, price in items:
+            self.add(description, qty, price)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows.values())
+
+    def __contains__(self, description):
+        return description in self.row_ids
+
+    def __getitem__(self, row_id):
+        return self.rows[row_id]
+
+    def add(self, description, qty, price):
+        """
+        Appends a row and returns its ID. Raises ValueError if the description already exists.
+        """
+        if description in self.row_ids:
+            raise ValueError("This medicine description already exists.")
+        row_id = str(self.next_id)
+        self.next_id += 1
+        self.rows[row_id] = (description, qty, price)
+        self.row_ids[description] = row_id
+        self.total += qty * price
+        return row_id
+
+    def extend(self, items):
+        """
+        Appends already checked rows (see line_import.parse_rows) and returns the number added.
+        Raises ValueError, adding nothing, if any description already exists or repeats.
+        """
+        items = list(items)
+        descriptions = {description for description, _, _ in items}
+        if len(descriptions) < len(items) or not descriptions.isdisjoint(self.row_ids):
+            raise ValueError("This medicine description already exists.")
+        for description, qty, price in items:
+            row_id = str(self.next_id)
+            self.next_id += 1
+            self.rows[row_id] = (description, qty, price)
+            self.row_ids[description] = row_id
+        self.total += sum(qty * price for _, qty, price in items)
+        return len(items)
+
+    def update(self, row_id, description, qty, price):
+        """
+        Replaces a row in place. Raises ValueError if another row already has the description.
+        """
+        old_description, old_qty, old_price = self.rows[row_id]
+        if description != old_description:
+            if description in self.row_ids:
+                raise ValueError("This medicine description already exists.")
+            del self.row_ids[old_description]
+            self.row_ids[description] = row_id
+        self.rows[row_id] = (description, qty, price)
+        self.total += qty * price - old_qty * old_price
+
+    def delete(self, row_id):
+        description, qty, price = self.rows.pop(row_id)
+        del self.row_ids[description]
+        # Start from a clean zero once empty so float rounding can't accumulate
+        self.total = self.total - qty * price if self.rows else 0.0
+
+    def clear(self):
+        self.rows.clear()
+        self.row_ids.clear()
+        self.total = 0.0
+
+    def window(self, first, count):
+        """
+        Returns up to count (row ID, row) pairs starting at position first, for virtualized views.
+        """
+        return list(islice(self.rows.items(), first, first + count))
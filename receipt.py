@@ -1,313 +1,19 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
-from tkcalendar import DateEntry  # Import DateEntry for the calendar widget
-from fpdf import FPDF
 from datetime import datetime
-import random
+import queue
+import subprocess
+import sys
+import threading
 import os
 
+from catalog import Catalog
+from line_items import LineItems
 
-# PDF Generator Class (modified to accept date)
-class ReceiptPDF(FPDF):
-    def __init__(self):
-        super().__init__()
-        self.is_last_page = False  # Track if the current page is the last
-
-        # Set increased margins: left, top, right
-        self.set_margins(20, 20, 20)  # 20 mm margins on all sides
-        # Adjusted the bottom margin to accommodate all footer elements
-        self.set_auto_page_break(auto=True, margin=60)  # Auto page break with 60 mm bottom margin
-
-    def header(self):
-        # Define dimensions
-        logo_width = 30  # Width of the logo in mm
-        logo_height = 30  # Height of the logo in mm
-        space_between = 10  # Space between logo and text in mm
-
-        # Define header position
-        header_y = 20  # Top margin in mm (aligned with increased margin)
-
-        # Set font for the header - Increase size for larger and bold text
-        font_size = 24  # Increased font size
-        font_style = "B"  # Bold
-        self.set_font("Arial", font_style, font_size)
-        text = "MAA MEDICAL CENTER"
-        text_width = self.get_string_width(text)
-
-        # Calculate total width of logo and text
-        total_width = logo_width + space_between + text_width
-
-        # Calculate the starting x position to center the logo and text
-        start_x = (self.w - total_width) / 2
-
-        # Insert the logo with error handling
-        logo_path = "build/logo.png"
-        if os.path.exists(logo_path):
-            self.image(logo_path, x=start_x, y=header_y, w=logo_width, h=logo_height)
-        else:
-            # Handle missing image, e.g., log a warning or use a placeholder
-            print(f"Warning: Logo image not found at {logo_path}. Skipping logo.")
-
-        # Calculate the vertical position to center the text relative to the logo
-        text_height = font_size * 0.3528  # Convert font size from points to mm
-        text_y = header_y + (logo_height - text_height) / 2
-
-        # Position the text right next to the logo
-        self.set_xy(start_x + logo_width + space_between, text_y)
-        self.cell(text_width, text_height, text, border=0, ln=0, align='L')
-
-        # Calculate the position for the custom underline
-        underline_thickness = 0.5  # Thickness of the underline in mm
-        underline_spacing = 2  # Space between text and underline in mm
-        underline_y = text_y + text_height + underline_spacing
-
-        # Draw the custom underline
-        self.set_line_width(underline_thickness)
-        self.line(
-            start_x + logo_width + space_between,
-            underline_y,
-            start_x + logo_width + space_between + text_width,
-            underline_y
-        )
-
-        # Move to the next line after the header
-        max_header_y = header_y + logo_height
-        self.set_y(max_header_y + 10)  # Add 10 mm space below the header
-
-        # Set font for the subtitle or additional information
-        self.set_font("Arial", size=10)
-
-        # Add the multi-line cell with centered alignment within the margins
-        self.set_x(self.l_margin)
-        self.multi_cell(
-            0,
-            5,
-            "Drugs, Operation Disposables, CT, MRI, ANGIOGRAM, PET CT Contrast, Medicine Supplier\n166/5 Matikata MP Check Post, Dhaka Cantonment, Dhaka-1206",
-            align="C"
-        )
-
-        # Add some space after the header section
-        self.ln(10)
-
-    def footer(self):
-        # Set the font for the footer
-        self.set_font("Arial", "I", 8)
-
-        if self.is_last_page:
-            # Signature Section
-            self.set_y(-60)  # Position 60 mm from the bottom
-            self.set_font("Arial", size=10)
-            self.set_x(self.l_margin)
-            
-            # Customer Signature
-            self.cell(70, 10, "__________________________", align="L", ln=0)
-            # Spacer
-            self.cell(31, 10, "", ln=0)
-            # Maa Medical Center Signature
-            self.cell(70, 10, "__________________________", align="R", ln=1)
-            
-            # Labels for Signatures
-            self.set_x(self.l_margin)
-            self.cell(70, 5, "Customer Signature", align="L", ln=0)
-            self.cell(31, 5, "", ln=0)
-            self.cell(70, 5, "Maa Medical Center Thank You", align="R", ln=1)
-            
-            # Add spacing between signatures and "Sold Items Not Taken"
-            self.ln(10)  # Add 10 mm space
-
-        # "Sold Items Not Taken" Section
-        self.set_y(-35)  # Position 35 mm from the bottom
-        self.set_font("Arial", "B", 10)
-        self.set_x(self.l_margin)
-        self.cell(0, 10, "Sold Items Not Taken", border=1, align="C", ln=1)
-
-        # "MAA MEDICAL CENTER" at the very bottom
-        self.set_y(-15)  # Position 15 mm from the bottom
-        self.set_font("Arial", "I", 8)
-        self.set_x(self.l_margin)
-        self.cell(0, 10, "MAA MEDICAL CENTER " * 5, align="C")
-
-
-    def customer_details(self, name, address, mobile):
-        self.set_font("Arial", size=10)
-        self.set_x(self.l_margin)
-        self.cell(0, 10, f"Name: {name}", ln=True)
-        self.set_x(self.l_margin)
-        self.cell(0, 10, f"Address: {address}", ln=True)
-        self.set_x(self.l_margin)
-        self.cell(0, 10, f"Mobile No: {mobile}", ln=True)
-        self.ln(10)
-
-    def invoice_details(self, invoice_no, date):
-        self.set_font("Arial", size=10)
-        self.set_x(self.l_margin)
-        self.cell(100, 10, f"INVOICE NUMBER: {invoice_no}", ln=0, align="L")
-        self.cell(0, 10, f"Date: {date}", ln=1, align="R")
-        self.ln(5)
-
-    def add_table(self, medicines, advance):
-        # Define column names and their width percentages
-        columns = [
-            {"title": "SL No", "percentage": 0.15},
-            {"title": "Medicine Details", "percentage": 0.45},
-            {"title": "QTY", "percentage": 0.10},
-            {"title": "Price", "percentage": 0.15},
-            {"title": "Amount", "percentage": 0.15},
-        ]
-
-        # Calculate the effective page width (A4 width - left margin - right margin)
-        effective_width = self.w - 2 * self.l_margin
-
-        # Calculate column widths based on percentages
-        col_widths = {col["title"]: col["percentage"] * effective_width for col in columns}
-
-        # Set the x position for the table to align with left margin
-        self.set_x(self.l_margin)
-
-        # Set font for table header
-        self.set_font("Arial", "B", 10)
-
-        # Create table header
-        for col in columns:
-            self.cell(col_widths[col["title"]], 10, col["title"], 1, align="C")
-        self.ln()
-
-        # Set font for table body
-        self.set_font("Arial", size=10)
-        total_amount = 0
-
-        for idx, medicine in enumerate(medicines, 1):
-            description, qty, price = medicine
-            amount = qty * price
-            total_amount += amount
-
-            # Determine the maximum number of lines for the Medicine Details
-            # Calculate number of lines needed
-            description_lines = self.get_multi_cell_lines(col_widths["Medicine Details"], 10, description)
-
-            # Define row height based on number of lines (10 mm per line)
-            row_height = 10 * description_lines
-
-            # Check if a new page is needed
-            # Adjusted reserved space from 60 to 60 mm to align with the new footer margin
-            if self.get_y() + row_height > self.h - 60:
-                self.add_page()
-                # Recreate table header on the new page
-                self.set_x(self.l_margin)
-                self.set_font("Arial", "B", 10)
-                for col in columns:
-                    self.cell(col_widths[col["title"]], 10, col["title"], 1, align="C")
-                self.ln()
-                self.set_font("Arial", size=10)
-
-            # Save the current x and y positions
-            x_before = self.get_x()
-            y_before = self.get_y()
-
-            # Draw the SL No cell
-            self.set_x(self.l_margin)
-            self.cell(col_widths["SL No"], row_height, str(idx), 1, align="C", ln=0, fill=False)
-
-            # Draw the Medicine Details cell with multi_cell
-            self.multi_cell(col_widths["Medicine Details"], 10, description, border=1, align="L")
-            # After multi_cell, the cursor moves to the next line. We need to reset x and y
-            # to continue drawing the rest of the cells in the row
-            self.set_xy(x_before + col_widths["SL No"] + col_widths["Medicine Details"], y_before)
-
-            # Draw the QTY cell
-            self.cell(col_widths["QTY"], row_height, str(qty), 1, align="C", ln=0, fill=False)
-
-            # Draw the Price cell
-            self.cell(col_widths["Price"], row_height, f"{price:.2f}", 1, align="C", ln=0, fill=False)
-
-            # Draw the Amount cell
-            self.cell(col_widths["Amount"], row_height, f"{amount:.2f}", 1, align="C", ln=1, fill=False)
-
-        # Add Total, Paid, Due rows
-        # Calculate label width (sum of SL No, Medicine Details, QTY, Price)
-        total_label_width = col_widths["SL No"] + col_widths["Medicine Details"] + col_widths["QTY"] + col_widths["Price"]
-
-        # Total
-        self.set_font("Arial", "B", 10)
-        self.set_x(self.l_margin)
-        self.cell(total_label_width, 10, "Total ", 1, align="R")
-        self.cell(col_widths["Amount"], 10, f"{total_amount:.2f}", 1, align="C")
-        self.ln()
-
-        # Paid
-        self.set_x(self.l_margin)
-        self.cell(total_label_width, 10, "Paid ", 1, align="R")
-        self.cell(col_widths["Amount"], 10, f"{advance:.2f}", 1, align="C")
-        self.ln()
-
-        # Due
-        due = total_amount - advance
-        self.set_x(self.l_margin)
-        self.cell(total_label_width, 10, "Due ", 1, align="R")
-        self.cell(col_widths["Amount"], 10, f"{due:.2f}", 1, align="C")
-        self.ln()
-
-        # Add the amount in words
-        self.set_font("Arial", size=10)
-        self.set_x(self.l_margin)
-        self.multi_cell(0, 10, f"Taka (in Words): {self.number_to_words(int(total_amount))} Taka Only.", align="L")
-
-        # Add extra spacing before the footer
-        self.ln(10)  # Reduced from 15 to 10 to prevent pushing content into the footer
-
-    def get_multi_cell_lines(self, width, height, text):
-        """
-        Helper method to calculate the number of lines needed for a given text in a multi_cell.
-        """
-        # Temporarily set the cell to calculate the number of lines
-        original_font = self.font_family, self.font_style, self.font_size_pt
-        self.set_font(*original_font)
-        # Split the text into lines that fit within the cell width
-        lines = self.multi_cell(width, height, text, border=0, align='L', split_only=True)
-        return len(lines) if lines else 1
-
-    def finalize_last_page(self):
-        self.is_last_page = True
-
-    def number_to_words(self, n):
-        """
-        Converts a number into words.
-        """
-        units = ["", "One", "Two", "Three", "Four", "Five", "Six",
-                 "Seven", "Eight", "Nine"]
-        teens = ["", "Eleven", "Twelve", "Thirteen", "Fourteen",
-                 "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen"]
-        tens = ["", "Ten", "Twenty", "Thirty", "Forty", "Fifty",
-                "Sixty", "Seventy", "Eighty", "Ninety"]
-        thousands = ["", "Thousand", "Million", "Billion"]
-
-        def convert_chunk(chunk):
-            words = []
-            if chunk >= 100:
-                words.append(units[chunk // 100] + " Hundred")
-                chunk %= 100
-            if 10 < chunk < 20:
-                words.append(teens[chunk - 10])
-            else:
-                if chunk >= 10:
-                    words.append(tens[chunk // 10])
-                if chunk % 10 > 0:
-                    words.append(units[chunk % 10])
-            return " ".join(words)
-
-        if n == 0:
-            return "Zero"
-
-        words = []
-        chunk_count = 0
-        while n > 0:
-            chunk = n % 1000
-            if chunk > 0:
-                words.append(convert_chunk(chunk) + " " + thousands[chunk_count])
-            n //= 1000
-            chunk_count += 1
-
-        return " ".join(reversed(words)).strip()
+# Only what the form needs is imported up front. The PDF stack (render, fpdf),
+# the ledger, the render cache, the calendar widget (tkcalendar, babel) and
+# random are imported on first use or on background threads once the window
+# has been shown, so the form paints quickly, even from the frozen build.
 
 
 # Validation Functions
@@ -330,82 +36,199 @@ def validate_decimal(P):
 
 # PDF Generator Function (modified to accept date)
 def generate_receipt(medicines, date_str):
-    customer_name = entry_name.get().strip()
-    customer_address = entry_address.get().strip()
-    customer_mobile = entry_mobile.get().strip()
-    advance_amount = entry_advance.get().strip()
-
-    if not customer_name:
-        messagebox.showerror("Input Error", "Name is required.")
+    invoice = {
+        "name": entry_name.get(),
+        "address": entry_address.get(),
+        "mobile": entry_mobile.get(),
+        "paid": entry_advance.get(),
+        "date": date_str,
+        "medicines": medicines,
+        "invoice_number": form_invoice_number,  # Set when a failed receipt was put back in the form
+    }
+
+    # Validate on the UI thread so input errors show up right away
+    from render import InvoiceError, validate_invoice  # Normally loaded already by the render worker
+    try:
+        invoice = validate_invoice(invoice)
+    except InvoiceError as e:
+        messagebox.showerror(e.title, str(e))
         return
 
-    if not customer_mobile.isdigit():
-        messagebox.showerror("Input Error", "Mobile number must contain only digits.")
-        return
+    # Hand the validated snapshot to the render worker and free the form for the next customer
+    render_jobs.put(invoice)
+    update_render_status()
+    clear_form()
+    restore_failed_invoice()
 
-    if not advance_amount:
-        messagebox.showerror("Input Error", "Paid amount is required.")
-        return
 
-    try:
-        advance = float(advance_amount)
-    except ValueError:
-        messagebox.showerror("Input Error", "Advance amount must contain only digits and at most one decimal point.")
-        return
+# Pack the receipts of earlier days into Archive/<yyyy-mm-dd>.pack at startup (see archive.py)
+ARCHIVE_CLOSED_DAYS = False
 
-    if not medicines:
-        messagebox.showerror("Input Error", "At least one medicine must be added to generate the receipt.")
-        return
 
-    # Calculate total amount
-    total_amount = sum(qty * price for _, qty, price in medicines)
-    if advance > total_amount:
-        messagebox.showerror("Input Error", f"Paid amount ({advance:.2f}) cannot exceed the total amount ({total_amount:.2f}).")
-        return
+def archive_closed_days():
+    from archive import Archive
+    with Archive() as archive:
+        archive.pack()
 
-    # Parse the selected date from 'dd/mm/yyyy' to 'yyyy-mm-dd'
-    try:
-        selected_date = datetime.strptime(date_str, '%d/%m/%Y').strftime('%Y-%m-%d')
-    except ValueError:
-        messagebox.showerror("Date Error", "Invalid date format. Please select a valid date.")
-        return
 
-    # Create invoice ID and filename
-    invoice_number = f"INV{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    sanitized_name = customer_name.replace(" ", "_").replace("/", "-")
-    pdf_filename = f"receipt_{invoice_number}_{sanitized_name}.pdf"
+# Background rendering
+render_jobs = queue.Queue()  # Validated invoices waiting to be rendered
+render_results = queue.Queue()  # (invoice, pdf path or None, error message or None, queue to retry in or None)
+failed_invoices = []  # Invoices whose receipt failed, waiting for the form to be free
+form_invoice_number = None  # Number of the failed invoice put back in the form, reused when it is generated again
 
-    # Create a folder for the selected date
-    date_folder = f"Receipts/{selected_date}"  # e.g., "Receipts/2024-09-15"
-    if not os.path.exists(date_folder):
-        os.makedirs(date_folder)  # Create the folder if it doesn't exist
+# Print counter receipts straight to an ESC/POS thermal printer (see escpos.py)
+# instead of opening a PDF: a device path such as "/dev/usb/lp0" or
+# r"\\localhost\Thermal", or None for PDF receipts.
+THERMAL_PRINTER = None
+THERMAL_PAPER_WIDTH = 80  # 58 or 80 mm
+THERMAL_ARCHIVE_PDF = True  # Still write the PDF to Receipts/, after the receipt is printed
 
-    # Full path to save the PDF
-    pdf_path = os.path.join(date_folder, pdf_filename)
+archive_jobs = queue.Queue()  # Printed invoices waiting for their PDF copy
 
-    # Generate the PDF
-    pdf = ReceiptPDF()
-    pdf.add_page()
-    pdf.invoice_details(invoice_no=invoice_number, date=date_str)  # Pass the selected date in original format
-    pdf.customer_details(name=customer_name, address=customer_address, mobile=customer_mobile)
-    pdf.add_table(medicines, advance)
-    pdf.finalize_last_page()
-    pdf.output(pdf_path)
 
-    # Show success message
-    messagebox.showinfo("Success", f"Receipt saved as {pdf_path}")
+def render_worker():
+    """
+    Renders queued invoices one at a time off the Tk main thread, writes them
+    to Receipts/<yyyy-mm-dd>/, records them in the ledger and opens them in
+    the default viewer. With THERMAL_PRINTER set, prints them on the thermal
+    printer instead and leaves the PDF copy to archive_worker.
+    """
+    # Imported here, off the Tk main thread, so they never delay the first paint
+    from ledger import Ledger
+    from render import write_receipt
+    from render_cache import RenderCache
+    import timing
+
+    ledger = Ledger()  # SQLite connections stay on the thread that opened them
+    cache = RenderCache()  # Lets the ledger's reprints reuse these PDFs
+    while True:
+        invoice = render_jobs.get()
+        try:
+            with timing.receipt(invoice["invoice_number"]):
+                if THERMAL_PRINTER:
+                    from escpos import print_ticket
+                    with timing.stage("print_ticket"):
+                        print_ticket(invoice, THERMAL_PRINTER, THERMAL_PAPER_WIDTH)
+                    if THERMAL_ARCHIVE_PDF:
+                        archive_jobs.put(invoice)
+                    else:
+                        with timing.stage("ledger"):
+                            ledger.record(invoice)
+                    render_results.put((invoice, None, None, None))
+                    continue
+                pdf_path = write_receipt(invoice, cache=cache)  # Already validated by generate_receipt
+                with timing.stage("ledger"):
+                    ledger.record(invoice, pdf_path)
+                try:
+                    with timing.stage("open_viewer"):
+                        open_pdf(pdf_path)
+                except OSError as e:
+                    # Saved and recorded; only the viewer failed, so there is nothing to retry
+                    render_results.put((invoice, pdf_path, f"Saved as {pdf_path} but could not open it: {e}", None))
+                    continue
+            render_results.put((invoice, pdf_path, None, None))
+        except Exception as e:
+            # The snapshot goes back with the error, so the receipt can be retried or the invoice put back in the form
+            render_results.put((invoice, None, str(e), render_jobs))
+        finally:
+            render_jobs.task_done()
+
+
+def archive_worker():
+    """
+    Writes the PDF copy of printed receipts and records them in the ledger, so
+    the next customer's receipt never waits for a PDF.
+    """
+    from ledger import Ledger
+    from render import write_receipt
+    from render_cache import RenderCache
+
+    ledger = Ledger()
+    cache = RenderCache()
+    while True:
+        invoice = archive_jobs.get()
+        try:
+            ledger.record(invoice, write_receipt(invoice, cache=cache))
+        except Exception as e:
+            render_results.put((invoice, None, f"PDF copy not saved: {e}", archive_jobs))
+        finally:
+            archive_jobs.task_done()
 
-    # Auto-open the PDF file
-    try:
+
+def open_pdf(pdf_path):
+    """
+    Opens the PDF in the default viewer without waiting for it.
+    """
+    if sys.platform.startswith("win"):
         os.startfile(pdf_path)  # For Windows
-    except AttributeError:
+    elif sys.platform == "darwin":
+        subprocess.Popen(["open", pdf_path])  # For macOS
+    else:
+        subprocess.Popen(["xdg-open", pdf_path])  # For Linux
+
+
+def poll_render_results():
+    """
+    Picks up finished jobs from the worker; runs every 100 ms on the Tk event loop.
+    """
+    while True:
         try:
-            os.system(f"open {pdf_path}")  # For macOS
-        except Exception:
-            os.system(f"xdg-open {pdf_path}")  # For Linux
+            invoice, pdf_path, error, retry_jobs = render_results.get_nowait()
+        except queue.Empty:
+            break
+        invoice_number = invoice["invoice_number"]
+        if error and retry_jobs is None:
+            messagebox.showerror("Receipt Error", f"Receipt {invoice_number}: {error}")
+        elif error:
+            if messagebox.askyesno("Receipt Error",
+                                   f"Could not create receipt {invoice_number}: {error}\n\nTry again?"):
+                retry_jobs.put(invoice)
+            elif retry_jobs is render_jobs:
+                # Keep the customer's details and medicines: back into the form, now or once it is free
+                failed_invoices.append(invoice)
+                restore_failed_invoice()
+        elif pdf_path:
+            status_label.config(text=f"Receipt saved as {pdf_path}")
+        else:
+            status_label.config(text=f"Receipt {invoice_number} sent to the printer")
+    update_render_status()
+    if closing and not pending_receipts() and render_results.empty():
+        finish_closing()  # Every queued receipt is done and its result has been shown
+        return
+    app.after(100, poll_render_results)
 
-    # Clear the form
-    clear_form()
+
+def restore_failed_invoice():
+    """
+    Puts the oldest failed invoice back into the form (and the draft journal) if the form is empty.
+    """
+    global medicines, form_invoice_number
+    if not failed_invoices or medicines or any(widget.get().strip() for widget in draft_field_names):
+        return
+    invoice = failed_invoices.pop(0)
+    paid = invoice["paid"]
+    fields = {"name": invoice["name"], "address": invoice["address"], "mobile": invoice["mobile"],
+              "paid": str(int(paid)) if paid.is_integer() else str(paid)}
+    for widget, name in draft_field_names.items():
+        widget.delete(0, tk.END)
+        widget.insert(0, fields[name])
+        journaled_fields[name] = fields[name]
+        journal("field", name=name, value=fields[name])
+    set_form_date(datetime.strptime(invoice["date"], "%d/%m/%Y"))
+    medicines = LineItems(invoice["medicines"])
+    update_medicine_list(medicines)
+    journal("replace", items=list(medicines))
+    form_invoice_number = invoice["invoice_number"]
+    status_label.config(text=f"Receipt {form_invoice_number} was not created; its invoice is back in the form")
+
+
+def update_render_status():
+    pending = pending_receipts() if closing else render_jobs.unfinished_tasks
+    if pending and closing:
+        status_label.config(text=f"Finishing {pending} receipt{'s' if pending > 1 else ''} before closing...")
+    elif pending:
+        status_label.config(text=f"Generating {pending} receipt{'s' if pending > 1 else ''}...")
 
 
 # Function to clear the form
@@ -413,12 +236,13 @@ def clear_form():
     """
     Clears all input fields and the medicine table.
     """
+    global form_invoice_number
     # Clear customer details
     entry_name.delete(0, tk.END)
     entry_address.delete(0, tk.END)
     entry_mobile.delete(0, tk.END)
     entry_advance.delete(0, tk.END)
-    date_entry.set_date(datetime.now())  # Reset date to today
+    set_form_date(datetime.now())  # Reset date to today
 
     # Clear medicine fields
     entry_description.delete(0, tk.END)
@@ -426,9 +250,11 @@ def clear_form():
     entry_price.delete(0, tk.END)
 
     # Clear the table and medicines list
-    global medicines
-    medicines = []
+    medicines.clear()
     update_medicine_list(medicines)
+    journaled_fields.clear()
+    journal("clear")
+    form_invoice_number = None
 
 
 # Function to add a medicine
@@ -449,13 +275,14 @@ def add_medicine(medicines):
         messagebox.showerror("Input Error", "Price must be greater than 0.")
         return
 
-    for med in medicines:
-        if med[0] == description:
-            messagebox.showerror("Input Error", "This medicine description already exists.")
-            return
+    if description in medicines:
+        messagebox.showerror("Input Error", "This medicine description already exists.")
+        return
 
-    medicines.append((description, qty, price))
-    update_medicine_list(medicines)
+    row_id = medicines.add(description, qty, price)
+    journal("add", id=row_id, description=description, qty=qty, price=price)
+    update_total_amount()
+    show_medicines(len(medicines))  # Scroll to the new row
     entry_description.delete(0, tk.END)
     entry_qty.delete(0, tk.END)
     entry_price.delete(0, tk.END)
@@ -501,14 +328,17 @@ def update_medicine(medicines):
         messagebox.showerror("Input Error", "All fields must be filled with valid values.")
         return
 
-    # Update the medicines list
-    for i, (desc, _, _) in enumerate(medicines):
-        if desc == tree.item(selected_item, 'values')[1]:
-            medicines[i] = (description, qty, price)
-            break
+    # Update the medicines list (tree item IDs are row IDs)
+    try:
+        medicines.update(selected_item, description, qty, price)
+    except ValueError as e:
+        messagebox.showerror("Input Error", str(e))
+        return
+    journal("update", id=selected_item, description=description, qty=qty, price=price)
+    update_total_amount()
 
     # Update the table and clear input fields
-    update_medicine_list(medicines)
+    show_medicines()
     entry_description.delete(0, tk.END)
     entry_qty.delete(0, tk.END)
     entry_price.delete(0, tk.END)
@@ -524,39 +354,401 @@ def delete_medicine(medicines):
         messagebox.showerror("Selection Error", "No medicine selected for deletion.")
         return
 
-    # Find and remove the medicine from the list
-    selected_desc = tree.item(selected_item, 'values')[1]
-    medicines[:] = [med for med in medicines if med[0] != selected_desc]
+    # Remove the medicine from the list (tree item IDs are row IDs)
+    medicines.delete(selected_item)
+    journal("delete", id=selected_item)
+    update_total_amount()
 
-    # Update the table
-    update_medicine_list(medicines)
+    # Update the table; only the visible rows below it are renumbered
+    show_medicines()
+
+
+# Bulk import of line items (see line_import.py)
+def import_rows(medicines, rows, source):
+    """
+    Checks every row in one pass, reports the bad ones and adds the rest to the table in one update.
+    """
+    from line_import import format_errors, parse_rows
+
+    try:
+        items, errors = parse_rows(rows, medicines)
+    except Exception as e:  # Rows are read lazily, so unreadable files (bad encoding, corrupt workbook) fail here
+        messagebox.showerror("Import Error", f"Could not read {source}: {e}")
+        return
+
+    if errors and not items:
+        messagebox.showerror("Import Error", f"No medicines imported from {source}:\n\n{format_errors(errors)}")
+        return
+    if errors and not messagebox.askyesno(
+            "Import Error",
+            f"{len(errors)} row{'s' if len(errors) > 1 else ''} in {source} cannot be imported:\n\n"
+            f"{format_errors(errors)}\n\nImport the other {len(items)} medicines?"):
+        return
+    if not items:
+        messagebox.showinfo("Import", f"No medicines found in {source}.")
+        return
+
+    medicines.extend(items)
+    journal("extend", items=items)
+    update_total_amount()
+    show_medicines(len(medicines))  # Scroll to the imported rows
+    status_label.config(text=f"Imported {len(items)} medicines from {source}")
+
+
+def paste_medicines(medicines):
+    """
+    Imports rows copied from a spreadsheet (tab-separated) or CSV text on the clipboard.
+    """
+    from line_import import read_text
+    try:
+        text = app.clipboard_get()
+    except tk.TclError:
+        messagebox.showerror("Paste Error", "The clipboard has no text to paste.")
+        return "break"
+    import_rows(medicines, read_text(text), "the clipboard")
+    return "break"
+
+
+def import_medicines(medicines):
+    """
+    Imports rows from a CSV or Excel file picked by the user.
+    """
+    from tkinter import filedialog
+    from line_import import LineImportError, read_file
+    path = filedialog.askopenfilename(
+        title="Import Medicines",
+        filetypes=[("Spreadsheets", "*.xlsx *.csv *.tsv *.txt"), ("All files", "*.*")],
+    )
+    if not path:
+        return
+    try:
+        rows = read_file(path)
+    except LineImportError as e:
+        messagebox.showerror("Import Error", str(e))
+        return
+    import_rows(medicines, rows, os.path.basename(path))
 
 
 # Function to update the total amount label
 def update_total_amount():
-    total = sum(qty * price for _, qty, price in medicines)
-    total_label.config(text=f"Total Amount: {total:.2f}")
+    total_label.config(text=f"Total Amount: {medicines.total:.2f}")
 
 
 # Function to update the medicine list in the treeview
 def update_medicine_list(medicines):
-    for row in tree.get_children():
-        tree.delete(row)
-    for idx, (description, qty, price) in enumerate(medicines, start=1):
-        tree.insert("", "end", values=(idx, description, qty, price, qty * price))
+    """
+    Full refresh after the whole list was replaced: redraws the total and the visible rows.
+    """
     update_total_amount()
+    show_medicines(0)
+
+
+# Virtualized medicine table
+# Only the VISIBLE_ROWS rows in view exist as Treeview items; their item IDs
+# are the medicines' row IDs, and scrolling moves the window.
+VISIBLE_ROWS = 10
+view_first = 0  # Index of the first medicine shown in the tree
+shown_rows = {}  # Tree item ID -> values currently displayed
+
+
+def show_medicines(first=None):
+    """
+    Shows medicines[first:first + VISIBLE_ROWS], touching only the tree items whose values changed.
+    """
+    global view_first
+    if first is None:
+        first = view_first
+    first = max(0, min(first, len(medicines) - VISIBLE_ROWS))
+    view_first = first
+    window = medicines.window(first, VISIBLE_ROWS)
+    last = first + len(window)
+
+    # Drop rows that left the window
+    in_window = {row_id for row_id, _ in window}
+    for iid in tree.get_children():
+        if iid not in in_window:
+            tree.delete(iid)
+            del shown_rows[iid]
+
+    # Insert or refresh the rows in the window; SL No comes from the position, so renumbering is lazy
+    for position, (iid, (description, qty, price)) in enumerate(window):
+        values = (first + position + 1, description, qty, price, qty * price)
+        if iid not in shown_rows:
+            tree.insert("", position, iid=iid, values=values)
+        elif shown_rows[iid] != values:
+            tree.item(iid, values=values)
+        shown_rows[iid] = values
+
+    # Update the scrollbar to the window's share of the list
+    if medicines:
+        tree_scroll.set(first / len(medicines), last / len(medicines))
+    else:
+        tree_scroll.set(0, 1)
+
+
+def scroll_medicines(*args):
+    """
+    Scrollbar command: ("moveto", fraction) or ("scroll", count, "units" | "pages").
+    """
+    if args[0] == "moveto":
+        first = round(float(args[1]) * len(medicines))
+    elif args[2] == "pages":
+        first = view_first + int(args[1]) * VISIBLE_ROWS
+    else:
+        first = view_first + int(args[1])
+    show_medicines(first)
+
+
+def wheel_medicines(event):
+    # Windows and macOS report event.delta; X11 sends Button-4/Button-5
+    if event.num == 4 or event.delta > 0:
+        show_medicines(view_first - 3)
+    else:
+        show_medicines(view_first + 3)
+    return "break"
+
+
+# Catalog autocomplete for the Medicine Details field
+catalog = Catalog()
+suggestions = []  # (description, price) pairs currently listed under the field
+
+
+def show_suggestions(event):
+    """
+    Refreshes the dropdown under entry_description from the catalog on every keystroke.
+    """
+    if event.keysym in ("Down", "Up", "Return", "Escape", "Tab"):
+        return
+    suggestions[:] = catalog.suggest(entry_description.get())
+    if not suggestions:
+        hide_suggestions()
+        return
+    suggestion_box.delete(0, tk.END)
+    for description, price in suggestions:
+        suggestion_box.insert(tk.END, f"{description}  ({price:.2f})")
+    suggestion_box.config(height=len(suggestions))
+    suggestion_box.place(in_=entry_description, x=0, rely=1.0, relwidth=1.0)
+    suggestion_box.lift()
+
+
+def hide_suggestions(event=None):
+    suggestion_box.place_forget()
+
+
+def focus_suggestions(event):
+    # Down arrow in the field moves into the dropdown
+    if suggestions:
+        suggestion_box.focus_set()
+        suggestion_box.selection_clear(0, tk.END)
+        suggestion_box.selection_set(0)
+        suggestion_box.activate(0)
+    return "break"
+
+
+def pick_suggestion(event=None):
+    """
+    Fills the description and catalog price from the chosen suggestion.
+    """
+    selection = suggestion_box.curselection()
+    if not selection:
+        return
+    description, price = suggestions[selection[0]]
+    entry_description.delete(0, tk.END)
+    entry_description.insert(0, description)
+    entry_price.delete(0, tk.END)
+    entry_price.insert(0, f"{price:.2f}")  # Not :g, which rounds to 6 digits or switches to an exponent
+    hide_suggestions()
+    entry_qty.focus_set()
+
+
+def hide_suggestions_later(event):
+    # Give a click on the dropdown time to register before hiding it
+    app.after(150, lambda: None if app.focus_get() == suggestion_box else hide_suggestions())
 
 
 # Function to generate dummy data
 def generate_dummy_data():
     global medicines
-    medicines = [
+    import random
+    medicines = LineItems(
         (f"Medicine {i}", random.randint(1, 10), round(random.uniform(50.0, 500.0), 2))
         for i in range(1, 21)
-    ]
+    )
+    journal("replace", items=list(medicines))
     update_medicine_list(medicines)
 
 
+# Draft journal (see drafts.py): every change to the form is logged so an
+# unfinished invoice survives a crash and is put back on the next start
+draft = None  # DraftJournal, started by restore_draft once the window is shown
+journaled_fields = {}  # Customer field -> text last written to the journal
+
+
+def journal(op, **fields):
+    """
+    Queues a change to the in-progress invoice for the draft journal; never waits for the disk.
+    """
+    if draft is not None:
+        draft.record(op, **fields)
+
+
+def note_field(event):
+    """
+    Journals a customer field whose text has changed (bound to key release and focus out).
+    """
+    name = draft_field_names[event.widget]
+    value = event.widget.get()
+    if journaled_fields.get(name, "") != value:
+        journaled_fields[name] = value
+        journal("field", name=name, value=value)
+
+
+def restore_draft():
+    """
+    Puts back an invoice left unfinished by a crash or by closing the app, then starts the journal.
+    """
+    global draft, medicines
+    from drafts import DraftJournal, DraftState, replay
+
+    state, _ = replay()
+    restored = DraftState()
+    if not state.is_empty():
+        for widget, name in draft_field_names.items():
+            value = state.fields.get(name, "")
+            widget.delete(0, tk.END)
+            widget.insert(0, value)
+            journaled_fields[name] = value
+        medicines = LineItems(state.rows.values())
+        update_medicine_list(medicines)
+        restored.fields = dict(journaled_fields)
+        restored.apply({"op": "replace", "items": list(medicines)})  # Row IDs as renumbered by LineItems
+        status_label.config(text=f"Restored the unfinished invoice ({len(medicines)} medicines)")
+    draft = DraftJournal()
+    draft.start(restored)
+
+
+closing = False  # Set by close_app; poll_render_results closes the window once the workers are idle
+
+
+def pending_receipts():
+    # Receipts queued or being rendered, plus printed receipts still waiting for their PDF copy
+    return render_jobs.unfinished_tasks + archive_jobs.unfinished_tasks
+
+
+def close_app():
+    """
+    Closes the app once the queued receipts are done. The workers are daemon
+    threads and the form was cleared when each invoice was queued, so closing
+    straight away would lose them.
+    """
+    global closing
+    pending = pending_receipts()
+    if not pending:
+        finish_closing()
+    elif not closing:
+        closing = True
+        update_render_status()
+    elif messagebox.askyesno("Receipts Pending",
+                             f"{pending} receipt{'s are' if pending > 1 else ' is'} still pending and will be "
+                             f"lost if you close now.\n\nClose anyway?", icon="warning"):
+        finish_closing()
+
+
+def finish_closing():
+    # Commit the last journal records so the draft is there on the next start
+    if draft is not None:
+        draft.close()
+    app.destroy()
+
+
+# Date field: a plain dd/mm/yyyy entry until the calendar widget has loaded
+calendar_loaded = threading.Event()
+
+
+def load_calendar():
+    """
+    Imports tkcalendar (and babel) on a background thread.
+    """
+    try:
+        import tkcalendar  # Cached in sys.modules for install_calendar
+    except ImportError:
+        pass  # install_calendar keeps the plain entry
+    finally:
+        calendar_loaded.set()
+
+
+def install_calendar():
+    """
+    Replaces the plain date entry with the calendar widget, keeping the date typed so far.
+    Polls every 50 ms on the Tk event loop until load_calendar has finished.
+    """
+    global date_entry
+    if not calendar_loaded.is_set():
+        app.after(50, install_calendar)
+        return
+    try:
+        from tkcalendar import DateEntry
+    except ImportError:
+        return
+    try:
+        day = datetime.strptime(date_entry.get(), "%d/%m/%Y")
+    except ValueError:
+        day = datetime.now()
+    had_focus = app.focus_get() == date_entry
+    calendar_entry = DateEntry(app, width=37, background='darkblue',
+                               foreground='white', borderwidth=2, date_pattern='dd/mm/yyyy')
+    calendar_entry.set_date(day)
+    calendar_entry.grid(row=4, column=1, sticky="w", padx=10, pady=5)
+    calendar_entry.lift(date_entry)  # Keep its place in the Tab order
+    date_entry.destroy()
+    date_entry = calendar_entry
+    if had_focus:
+        date_entry.focus_set()
+
+
+def set_form_date(day):
+    if hasattr(date_entry, "set_date"):
+        date_entry.set_date(day)
+    else:
+        date_entry.delete(0, tk.END)
+        date_entry.insert(0, day.strftime("%d/%m/%Y"))
+
+
+# Startup: show the window first, then start everything that can wait
+STARTUP_REPORT = os.environ.get("RECEIPT_STARTUP_REPORT")  # Set by startup_check.py
+
+
+def on_first_map(event):
+    if event.widget is app:
+        app.unbind("<Map>")
+        app.after_idle(window_shown)
+
+
+def window_shown():
+    """
+    Runs once the main window is up: starts the render worker and the background loads.
+    """
+    if STARTUP_REPORT:
+        # Startup check: record when the window appeared and what was imported by then, then quit
+        import json
+        import time
+        with open(STARTUP_REPORT, "w", encoding="utf-8") as f:
+            json.dump({"shown_at": time.time(), "modules": sorted(sys.modules)}, f)
+        app.destroy()
+        return
+
+    restore_draft()
+    threading.Thread(target=render_worker, daemon=True).start()
+    if THERMAL_PRINTER and THERMAL_ARCHIVE_PDF:
+        threading.Thread(target=archive_worker, daemon=True).start()
+    threading.Thread(target=load_calendar, daemon=True).start()
+    install_calendar()
+    # Load the medicine catalog
+    catalog.load_in_background()
+    if ARCHIVE_CLOSED_DAYS:
+        threading.Thread(target=archive_closed_days, daemon=True).start()
+
+
 # Tkinter app setup
 app = tk.Tk()
 app.title("Money Receipt (Maa Medical Center)")
@@ -566,7 +758,7 @@ app.geometry("")  # Set a fixed window size for better layout control
 validate_digit = app.register(validate_digit_only)
 validate_decimal_cmd = app.register(validate_decimal)
 
-medicines = []
+medicines = LineItems()
 
 # Customer Details Frame
 tk.Label(app, text="Customer Details", font=("Arial", 14)).grid(row=0, column=0, columnspan=2, pady=10)
@@ -585,9 +777,8 @@ entry_mobile.grid(row=3, column=1, sticky="w", padx=10, pady=5)
 
 # Date Field
 tk.Label(app, text="Date:").grid(row=4, column=0, sticky="e", padx=10, pady=5)
-date_entry = DateEntry(app, width=37, background='darkblue',
-                       foreground='white', borderwidth=2, date_pattern='dd/mm/yyyy')
-date_entry.set_date(datetime.now())  # Set default date to today
+date_entry = tk.Entry(app, width=40)  # Replaced by the calendar widget by install_calendar
+set_form_date(datetime.now())  # Set default date to today
 date_entry.grid(row=4, column=1, sticky="w", padx=10, pady=5)
 
 # Medicine Details Frame
@@ -596,6 +787,18 @@ tk.Label(app, text="Medicine Details", font=("Arial", 14)).grid(row=5, column=0,
 tk.Label(app, text="Medicine Details:").grid(row=6, column=0, sticky="e", padx=10, pady=5)
 entry_description = tk.Entry(app, width=30)
 entry_description.grid(row=6, column=1, sticky="w", padx=10, pady=5)
+entry_description.bind("<KeyRelease>", show_suggestions)
+entry_description.bind("<Down>", focus_suggestions)
+entry_description.bind("<Escape>", hide_suggestions)
+entry_description.bind("<FocusOut>", hide_suggestions_later)
+
+# Catalog suggestions dropdown (placed under entry_description while typing)
+suggestion_box = tk.Listbox(app, exportselection=False)
+suggestion_box.bind("<Return>", pick_suggestion)
+suggestion_box.bind("<Double-Button-1>", pick_suggestion)
+suggestion_box.bind("<ButtonRelease-1>", pick_suggestion)
+suggestion_box.bind("<Escape>", lambda event: (hide_suggestions(), entry_description.focus_set()))
+suggestion_box.bind("<FocusOut>", hide_suggestions_later)
 
 tk.Label(app, text="Quantity:").grid(row=7, column=0, sticky="e", padx=10, pady=5)
 entry_qty = tk.Entry(app, width=10, validate="key", validatecommand=(validate_digit, "%P"))
@@ -609,9 +812,20 @@ entry_price.grid(row=8, column=1, sticky="w", padx=10, pady=5)
 tk.Button(app, text="Add Medicine", command=lambda: add_medicine(medicines)).grid(
     row=9, column=1, pady=10, sticky="w")
 
-# Medicines Treeview
-tree = ttk.Treeview(app, columns=("SL No", "Medicine Details", "Quantity", "Price", "Amount"), show="headings")
-tree.grid(row=10, column=0, columnspan=2, padx=20, pady=10)
+# Bulk import buttons, next to Add Medicine
+import_frame = tk.Frame(app)
+import_frame.grid(row=9, column=1, pady=10, padx=10, sticky="e")
+tk.Button(import_frame, text="Paste Medicines", command=lambda: paste_medicines(medicines)).pack(side="left", padx=5)
+tk.Button(import_frame, text="Import Medicines...", command=lambda: import_medicines(medicines)).pack(side="left")
+
+# Medicines Treeview (virtualized, with its own scrollbar)
+tree_frame = tk.Frame(app)
+tree_frame.grid(row=10, column=0, columnspan=2, padx=20, pady=10)
+tree = ttk.Treeview(tree_frame, columns=("SL No", "Medicine Details", "Quantity", "Price", "Amount"),
+                    show="headings", height=VISIBLE_ROWS)
+tree.pack(side="left")
+tree_scroll = ttk.Scrollbar(tree_frame, orient="vertical", command=scroll_medicines)
+tree_scroll.pack(side="right", fill="y")
 tree.heading("SL No", text="SL No")
 tree.heading("Medicine Details", text="Medicine Details")
 tree.heading("Quantity", text="Quantity")
@@ -619,6 +833,10 @@ tree.heading("Price", text="Price")
 tree.heading("Amount", text="Amount")
 
 tree.bind("<<TreeviewSelect>>", select_medicine)
+tree.bind("<MouseWheel>", wheel_medicines)
+tree.bind("<Button-4>", wheel_medicines)
+tree.bind("<Button-5>", wheel_medicines)
+tree.bind("<<Paste>>", lambda event: paste_medicines(medicines))  # Ctrl+V on the table
 
 # Update and Delete Buttons
 tk.Button(app, text="Update Medicine", command=lambda: update_medicine(medicines)).grid(
@@ -631,6 +849,12 @@ tk.Label(app, text="Paid Amount:").grid(row=12, column=0, sticky="e", padx=10, p
 entry_advance = tk.Entry(app, width=20, validate="key", validatecommand=(validate_decimal_cmd, "%P"))
 entry_advance.grid(row=12, column=1, sticky="w", padx=10, pady=5)
 
+# Customer fields kept in the draft journal
+draft_field_names = {entry_name: "name", entry_address: "address", entry_mobile: "mobile", entry_advance: "paid"}
+for widget in draft_field_names:
+    widget.bind("<KeyRelease>", note_field)
+    widget.bind("<FocusOut>", note_field)
+
 # Total Amount Label
 total_label = tk.Label(app, text="Total Amount: 0.00", font=("Arial", 12))
 total_label.grid(row=13, column=0, columnspan=2, pady=10)
@@ -644,6 +868,17 @@ tk.Button(app, text="Generate Receipt",
 tk.Button(app, text="Generate Dummy Data", command=generate_dummy_data).grid(
     row=15, column=0, columnspan=2, pady=10)
 
+# Receipt Status Label (progress and completion notices from the render worker)
+status_label = tk.Label(app, text="", fg="gray25")
+status_label.grid(row=16, column=0, columnspan=2, pady=5)
+
+# Poll the render worker for finished receipts; the worker, calendar and
+# catalog are started by window_shown once the window is up
+app.after(100, poll_render_results)
+app.bind("<Map>", on_first_map)
+app.protocol("WM_DELETE_WINDOW", close_app)
+
 
 # Start the Tkinter event loop
-app.mainloop()
+if __name__ == "__main__":
+    app.mainloop()
@@ -1,11 +1,17 @@
 # -*- mode: python ; coding: utf-8 -*-
+import glob
+import os
 
+# Files the app looks up through resources.resource_path: the receipt logo
+# and the Bangla fonts, if they have been put in fonts/
+datas = [('build/logo.png', 'build')]
+datas += [(path, 'fonts') for path in glob.glob(os.path.join(SPECPATH, 'fonts', '*.ttf'))]
 
 a = Analysis(
     ['receipt.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=datas,
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -16,19 +22,19 @@ a = Analysis(
 )
 pyz = PYZ(a.pure)
 
+# One-folder build: the libraries sit next to receipt.exe in dist/receipt/
+# instead of being unpacked to a temporary folder on every start, and they
+# are not UPX-compressed, so they load without being decompressed first.
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='receipt',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -37,3 +43,12 @@ exe = EXE(
     entitlements_file=None,
     icon=['build\\logo.ico'],
 )
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='receipt',
+)
@@ -0,0 +1,964 @@
+"""
+Headless receipt rendering.
+
+Everything needed to turn plain invoice data into a PDF receipt lives here,
+so back-office jobs and services can render receipts without Tk, tkcalendar
+or a display. The Tk app in receipt.py is a thin form on top of this module.
+
+An invoice is a plain dict:
+
+    {
+        "name": "Customer Name",
+        "address": "Street, City",
+        "mobile": "01700000000",
+        "date": "15/09/2024",            # dd/mm/yyyy, as shown in the form
+        "paid": "100.50",                # str or number
+        "medicines": [("Napa 500mg", 2, 12.5), ...],
+        "invoice_number": "INV...",      # optional, generated when missing
+    }
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+from fpdf import FPDF
+from datetime import datetime
+import math
+import os
+import zlib
+
+from fonts import UNICODE_FAMILY, add_unicode_font, needs_unicode_font, unicode_font_path
+from invoice_numbers import InvoiceNumbers
+from resources import resource_path
+from storage import FileSink
+from timing import receipt as timing_receipt, stage, timed
+
+LOGO_PATH = resource_path(os.path.join("build", "logo.png"))
+
+# Bump whenever a change makes the same invoice render differently; it is
+# part of the render cache key, so stale cached receipts are never served
+TEMPLATE_VERSION = 2
+
+# Optimized output profile: smaller files that look the same. Table cells
+# with wrapped descriptions get one rectangle for their border instead of
+# four separate lines per text line, and the logo is recompressed at the
+# highest zlib level once per process. Set to False for the plain output.
+# (Page content is always Flate compressed, and the logo and page chrome
+# are stored once per document and referenced from every page.)
+OPTIMIZE_OUTPUT = True
+
+# Fonts used by the header and footer, registered up front in this order so
+# every document numbers them the same way and cached chrome can be replayed
+CHROME_FONTS = [("Arial", "B", 24), ("Arial", "", 10), ("Arial", "B", 10), ("Arial", "I", 8)]
+
+# Receipt table columns and their share of the page width
+TABLE_COLUMNS = [
+    ("SL No", 0.15),
+    ("Medicine Details", 0.45),
+    ("QTY", 0.10),
+    ("Price", 0.15),
+    ("Amount", 0.15),
+]
+
+# Per-process caches shared by every ReceiptPDF
+_logo_cache = {}  # (logo path, optimized) -> parsed image info, or None when missing
+_chrome_cache = {}  # (kind, page geometry, ...) -> (content stream, end x, end y, last cell height)
+_wrap_cache = OrderedDict()  # (font family, style, size, column width, text) -> wrapped lines, in LRU order
+WRAP_CACHE_SIZE = 8192
+
+
+def load_logo(pdf, path=LOGO_PATH):
+    """
+    Returns the parsed logo (FPDF image info) for path, decoding the PNG only once per process.
+    Returns None, after a single warning, when the file is missing.
+    """
+    key = (path, pdf.optimize)
+    if key not in _logo_cache:
+        if os.path.exists(path):
+            logo = pdf._parsepng(path)
+            if pdf.optimize:
+                # Same pixels and predictors, smaller Flate streams
+                for name in ("data", "smask"):
+                    if name in logo:
+                        logo[name] = zlib.compress(zlib.decompress(logo[name]), 9)
+            _logo_cache[key] = logo
+        else:
+            # Handle missing image, e.g., log a warning or use a placeholder
+            if not any(cached_path == path for cached_path, _ in _logo_cache):
+                print(f"Warning: Logo image not found at {path}. Skipping logo.")
+            _logo_cache[key] = None
+    return _logo_cache[key]
+
+
+# PDF Generator Class (modified to accept date)
+class ReceiptPDF(FPDF):
+    def __init__(self):
+        super().__init__()
+        self.page_count = None  # Total pages, known once the table is laid out
+        self.body_top = None  # Where page content starts below the header
+        self.layout_first = True  # Lay out the whole table before drawing (needed for "Page X of Y")
+        self.templates = {}  # Chrome key -> (form XObject number, content stream) used in this document
+        self.optimize = OPTIMIZE_OUTPUT
+
+        # Set increased margins: left, top, right
+        self.set_margins(20, 20, 20)  # 20 mm margins on all sides
+        # Adjusted the bottom margin to accommodate all footer elements
+        self.set_auto_page_break(auto=True, margin=60)  # Auto page break with 60 mm bottom margin
+
+        # Register the chrome fonts and the logo before anything is drawn
+        for family, style, size in CHROME_FONTS:
+            self.set_font(family, style, size)
+        self.font_family, self.font_style, self.font_size_pt = "", "", 12
+        logo = load_logo(self)
+        if logo:
+            # Each document gets its own copy because FPDF drops the image data after writing it
+            self.images[LOGO_PATH] = dict(logo, i=len(self.images) + 1)
+            if "smask" in logo and self.pdf_version < "1.4":
+                self.pdf_version = "1.4"
+
+    @timed("header")
+    def header(self):
+        self.draw_chrome(("header",), self.draw_header)
+        self.body_top = self.get_y()
+
+    @timed("footer")
+    def footer(self):
+        self.draw_chrome(("footer", self.page == self.page_count), self.draw_footer)
+
+        self.draw_page_number()
+
+    def draw_page_number(self):
+        # "Page X of Y" between the "Sold Items Not Taken" box and the bottom line
+        if self.page_count:
+            self.set_y(-24)
+            self.set_font("Arial", "I", 8)
+            self.cell(0, 8, f"Page {self.page} of {self.page_count}", align="R")
+
+    # Text outside Latin-1 (Bangla) is printed in the Unicode TrueType font, everything else in Arial
+    def cell(self, w, h=0, txt="", border=0, ln=0, align="", fill=0, link=""):
+        if self.font_family != UNICODE_FAMILY and needs_unicode_font(txt):
+            with self.unicode_font():
+                return super().cell(w, h, txt, border, ln, align, fill, link)
+        return super().cell(w, h, txt, border, ln, align, fill, link)
+
+    def multi_cell(self, w, h, txt="", border=0, align="J", fill=0, split_only=False):
+        if self.font_family != UNICODE_FAMILY and needs_unicode_font(txt):
+            page = self.pages.get(self.page)
+            with self.unicode_font():
+                lines = super().multi_cell(w, h, txt, border, align, fill, split_only)
+            if split_only and page is not None:
+                self.pages[self.page] = page  # Only measured: drop the font switches from the page
+            return lines
+        return super().multi_cell(w, h, txt, border, align, fill, split_only)
+
+    @contextmanager
+    def unicode_font(self):
+        """
+        Switches to the Unicode font in the current style and size for the block.
+        The font is embedded (as a subset) only in documents that use it.
+        """
+        family, style, size = self.font_family, self.font_style, self.font_size_pt
+        path = unicode_font_path(style)
+        if path is None:
+            raise InvoiceError(UNICODE_FONT_MISSING)
+        add_unicode_font(self, UNICODE_FAMILY, style, path)
+        self.set_font(UNICODE_FAMILY, style, size)
+        try:
+            yield
+        finally:
+            self.set_font(family, style, size)
+
+    def draw_chrome(self, kind, draw):
+        """
+        Draws static page chrome as a form XObject shared by every page.
+
+        The first time a piece of chrome is drawn in this process its content
+        stream is captured and cached; after that each page only references
+        the form, so the header and footer are laid out once per process and
+        stored once per document.
+        """
+        key = kind + (self.w, self.h, self.l_margin, self.r_margin)
+        if key not in _chrome_cache:
+            line_width = self.line_width
+            page = self.pages[self.page]
+            self.font_family = ""  # Make the captured stream select every font it uses
+            draw(*kind[1:])
+            _chrome_cache[key] = (self.pages[self.page][len(page):], self.x, self.y, self.lasth)
+            self.pages[self.page] = page
+            self.line_width = line_width
+
+        stream, self.x, self.y, self.lasth = _chrome_cache[key]
+        if key not in self.templates:
+            self.templates[key] = (len(self.templates) + 1, stream)
+        self._out(f"/TPL{self.templates[key][0]} Do")
+        # The form's font and line width do not leak into the page, so make
+        # the next set_font() emit its own font selection
+        self.font_family = ""
+
+    def _putimages(self):
+        super()._putimages()
+        # Write the chrome forms next to the images; they share resource dict 2
+        filter = "/Filter /FlateDecode " if self.compress else ""
+        for key, (index, stream) in self.templates.items():
+            data = zlib.compress(stream.encode("latin-1")) if self.compress else stream
+            self._newobj()
+            self.templates[key] = (index, stream, self.n)
+            self._out(f"<</Type /XObject /Subtype /Form /BBox [0 0 {self.w_pt:.2f} {self.h_pt:.2f}] "
+                      f"/Resources 2 0 R {filter}/Length {len(data)}>>")
+            self._putstream(data)
+            self._out("endobj")
+
+    def _putxobjectdict(self):
+        super()._putxobjectdict()
+        for index, _, n in self.templates.values():
+            self._out(f"/TPL{index} {n} 0 R")
+
+    def draw_header(self):
+        # Define dimensions
+        logo_width = 30  # Width of the logo in mm
+        logo_height = 30  # Height of the logo in mm
+        space_between = 10  # Space between logo and text in mm
+
+        # Define header position
+        header_y = 20  # Top margin in mm (aligned with increased margin)
+
+        # Set font for the header - Increase size for larger and bold text
+        font_size = 24  # Increased font size
+        font_style = "B"  # Bold
+        self.set_font("Arial", font_style, font_size)
+        text = "MAA MEDICAL CENTER"
+        text_width = self.get_string_width(text)
+
+        # Calculate total width of logo and text
+        total_width = logo_width + space_between + text_width
+
+        # Calculate the starting x position to center the logo and text
+        start_x = (self.w - total_width) / 2
+
+        # Insert the logo (registered in __init__ when the file exists)
+        if LOGO_PATH in self.images:
+            self.image(LOGO_PATH, x=start_x, y=header_y, w=logo_width, h=logo_height)
+
+        # Calculate the vertical position to center the text relative to the logo
+        text_height = font_size * 0.3528  # Convert font size from points to mm
+        text_y = header_y + (logo_height - text_height) / 2
+
+        # Position the text right next to the logo
+        self.set_xy(start_x + logo_width + space_between, text_y)
+        self.cell(text_width, text_height, text, border=0, ln=0, align='L')
+
+        # Calculate the position for the custom underline
+        underline_thickness = 0.5  # Thickness of the underline in mm
+        underline_spacing = 2  # Space between text and underline in mm
+        underline_y = text_y + text_height + underline_spacing
+
+        # Draw the custom underline
+        self.set_line_width(underline_thickness)
+        self.line(
+            start_x + logo_width + space_between,
+            underline_y,
+            start_x + logo_width + space_between + text_width,
+            underline_y
+        )
+
+        # Move to the next line after the header
+        max_header_y = header_y + logo_height
+        self.set_y(max_header_y + 10)  # Add 10 mm space below the header
+
+        # Set font for the subtitle or additional information
+        self.set_font("Arial", size=10)
+
+        # Add the multi-line cell with centered alignment within the margins
+        self.set_x(self.l_margin)
+        self.multi_cell(
+            0,
+            5,
+            "Drugs, Operation Disposables, CT, MRI, ANGIOGRAM, PET CT Contrast, Medicine Supplier\n166/5 Matikata MP Check Post, Dhaka Cantonment, Dhaka-1206",
+            align="C"
+        )
+
+        # Add some space after the header section
+        self.ln(10)
+
+    def draw_footer(self, is_last_page):
+        # Set the font for the footer
+        self.set_font("Arial", "I", 8)
+
+        if is_last_page:
+            # Signature Section
+            self.set_y(-60)  # Position 60 mm from the bottom
+            self.set_font("Arial", size=10)
+            self.set_x(self.l_margin)
+
+            # Customer Signature
+            self.cell(70, 10, "__________________________", align="L", ln=0)
+            # Spacer
+            self.cell(31, 10, "", ln=0)
+            # Maa Medical Center Signature
+            self.cell(70, 10, "__________________________", align="R", ln=1)
+
+            # Labels for Signatures
+            self.set_x(self.l_margin)
+            self.cell(70, 5, "Customer Signature", align="L", ln=0)
+            self.cell(31, 5, "", ln=0)
+            self.cell(70, 5, "Maa Medical Center Thank You", align="R", ln=1)
+
+            # Add spacing between signatures and "Sold Items Not Taken"
+            self.ln(10)  # Add 10 mm space
+
+        # "Sold Items Not Taken" Section
+        self.set_y(-35)  # Position 35 mm from the bottom
+        self.set_font("Arial", "B", 10)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, "Sold Items Not Taken", border=1, align="C", ln=1)
+
+        # "MAA MEDICAL CENTER" at the very bottom
+        self.set_y(-15)  # Position 15 mm from the bottom
+        self.set_font("Arial", "I", 8)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, "MAA MEDICAL CENTER " * 5, align="C")
+
+
+    def customer_details(self, name, address, mobile):
+        self.set_font("Arial", size=10)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, f"Name: {name}", ln=True)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, f"Address: {address}", ln=True)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, f"Mobile No: {mobile}", ln=True)
+        self.ln(10)
+
+    def invoice_details(self, invoice_no, date):
+        self.set_font("Arial", size=10)
+        self.set_x(self.l_margin)
+        self.cell(100, 10, f"INVOICE NUMBER: {invoice_no}", ln=0, align="L")
+        self.cell(0, 10, f"Date: {date}", ln=1, align="R")
+        self.ln(5)
+
+    def table_header(self, col_widths):
+        # Set the x position for the table to align with left margin
+        self.set_x(self.l_margin)
+
+        # Set font for table header
+        self.set_font("Arial", "B", 10)
+
+        # Create table header
+        for title, width in col_widths.items():
+            self.cell(width, 10, title, 1, align="C")
+        self.ln()
+
+        # Set font for table body
+        self.set_font("Arial", size=10)
+
+    def summary_row(self, col_widths, label, amount):
+        """
+        Draws a bold label across the first four columns with an amount under "Amount".
+        """
+        # Calculate label width (sum of SL No, Medicine Details, QTY, Price)
+        total_label_width = col_widths["SL No"] + col_widths["Medicine Details"] + col_widths["QTY"] + col_widths["Price"]
+
+        self.set_font("Arial", "B", 10)
+        self.set_x(self.l_margin)
+        self.cell(total_label_width, 10, label, 1, align="R")
+        self.cell(col_widths["Amount"], 10, f"{amount:.2f}", 1, align="C")
+        self.ln()
+        self.set_font("Arial", size=10)
+
+    def paginate_table(self, medicines, col_widths):
+        """
+        Measures rows and decides the page breaks, yielding one page at a time.
+
+        Each page is a dict with its "rows" as (SL No, description lines, qty,
+        price, amount), the subtotal "brought" forward from the previous page
+        and the subtotal "carried" to the next one (None on the first and last
+        page). The last page also has "total_amount" and "words_text". Line
+        items are consumed lazily, so medicines may be any iterable.
+        """
+        self.set_font("Arial", size=10)
+        bottom = self.h - 60  # Keep clear of the footer and signature block
+
+        page = {"rows": [], "brought": None, "carried": None}
+        y = self.get_y() + 10  # Below the table header on the first page
+        total_amount = 0
+
+        for idx, (description, qty, price) in enumerate(medicines, 1):
+            amount = qty * price
+            lines = self.wrap_text(col_widths["Medicine Details"], description)
+            row_height = 10 * len(lines)
+
+            # Break before a row that would leave no room for the "Carried Forward" row
+            if page["rows"] and y + row_height + 10 > bottom:
+                page["carried"] = total_amount
+                yield page
+                page = {"rows": [], "brought": total_amount, "carried": None}
+                y = self.body_top + 20  # Below the table header and "Brought Forward" rows
+
+            page["rows"].append((idx, lines, qty, price, amount))
+            total_amount += amount
+            y += row_height
+
+        # Total, Paid and Due rows plus the amount in words stay together on the last page
+        words_text = f"Taka (in Words): {self.number_to_words(int(total_amount))} Taka Only."
+        totals_height = 30 + 10 * len(self.wrap_text(self.w - self.l_margin - self.r_margin, words_text))
+        if y + totals_height > bottom and page["rows"]:
+            page["carried"] = total_amount
+            yield page
+            page = {"rows": [], "brought": total_amount, "carried": None}
+
+        page["total_amount"] = total_amount
+        page["words_text"] = words_text
+        yield page
+
+    def layout_table(self, medicines, col_widths):
+        """
+        First pass of add_table: measures every row and decides all page breaks.
+
+        Also sets page_count, so the footer knows the last page and
+        "Page X of Y" before it is drawn.
+        """
+        pages = list(self.paginate_table(medicines, col_widths))
+        self.page_count = self.page + len(pages) - 1
+        return pages
+
+    @timed("add_table")
+    def add_table(self, medicines, advance):
+        """
+        Draws the line item table and the totals. Returns the total amount.
+        """
+        # Calculate the effective page width (A4 width - left margin - right margin)
+        effective_width = self.w - 2 * self.l_margin
+
+        # Calculate column widths based on percentages
+        col_widths = {title: percentage * effective_width for title, percentage in TABLE_COLUMNS}
+
+        # Measure all rows and place the page breaks before drawing anything
+        pages = self.layout_table(medicines, col_widths) if self.layout_first else self.paginate_table(medicines, col_widths)
+
+        for page_index, page in enumerate(pages):
+            if page_index:
+                self.add_page()
+            self.table_header(col_widths)
+            if page["brought"] is not None:
+                self.summary_row(col_widths, "Brought Forward ", page["brought"])
+
+            for idx, description_lines, qty, price, amount in page["rows"]:
+                # Define row height based on number of lines (10 mm per line)
+                row_height = 10 * len(description_lines)
+
+                # Save the current x and y positions
+                x_before = self.get_x()
+                y_before = self.get_y()
+
+                # Draw the SL No cell
+                self.set_x(self.l_margin)
+                self.cell(col_widths["SL No"], row_height, str(idx), 1, align="C", ln=0, fill=False)
+
+                # Draw the Medicine Details cell from the already wrapped lines
+                self.draw_lines(col_widths["Medicine Details"], 10, description_lines)
+                # After the lines, the cursor is on the next line. We need to reset x and y
+                # to continue drawing the rest of the cells in the row
+                self.set_xy(x_before + col_widths["SL No"] + col_widths["Medicine Details"], y_before)
+
+                # Draw the QTY cell
+                self.cell(col_widths["QTY"], row_height, str(qty), 1, align="C", ln=0, fill=False)
+
+                # Draw the Price cell
+                self.cell(col_widths["Price"], row_height, f"{price:.2f}", 1, align="C", ln=0, fill=False)
+
+                # Draw the Amount cell
+                self.cell(col_widths["Amount"], row_height, f"{amount:.2f}", 1, align="C", ln=1, fill=False)
+
+            if page["carried"] is not None:
+                self.summary_row(col_widths, "Carried Forward ", page["carried"])
+
+        total_amount = page["total_amount"]
+
+        # Add Total, Paid, Due rows
+        self.summary_row(col_widths, "Total ", total_amount)
+        self.summary_row(col_widths, "Paid ", advance)
+        self.summary_row(col_widths, "Due ", total_amount - advance)
+
+        # Add the amount in words
+        self.set_x(self.l_margin)
+        self.multi_cell(0, 10, page["words_text"], align="L")
+
+        # Add extra spacing before the footer
+        self.ln(10)  # Reduced from 15 to 10 to prevent pushing content into the footer
+        return total_amount
+
+    @timed("get_multi_cell_lines")
+    def get_multi_cell_lines(self, width, height, text):
+        """
+        Helper method to calculate the number of lines needed for a given text in a multi_cell.
+        """
+        return len(self.wrap_text(width, text))
+
+    @timed("wrap_text")
+    def wrap_text(self, width, text):
+        """
+        Splits text into the lines multi_cell would draw in the current font.
+
+        Results are kept in a bounded per-process LRU cache keyed by font, size,
+        width and text, since the same medicine names repeat across receipts.
+        """
+        key = (self.font_family, self.font_style, self.font_size_pt, width, text)
+        lines = _wrap_cache.get(key)
+        if lines is None:
+            lines = self.multi_cell(width, 0, text, border=0, align='L', split_only=True) or [""]
+            _wrap_cache[key] = lines
+            if len(_wrap_cache) > WRAP_CACHE_SIZE:
+                _wrap_cache.popitem(last=False)
+        else:
+            _wrap_cache.move_to_end(key)
+        return lines
+
+    def draw_lines(self, width, height, lines):
+        """
+        Draws pre-wrapped lines as one bordered, left-aligned block, like multi_cell(border=1).
+        """
+        if self.optimize:
+            # One rectangle draws the same border as the per-line side, top and bottom strokes
+            self.rect(self.x, self.y, width, height * len(lines))
+            for line in lines:
+                self.cell(width, height, line, 0, 2, 'L')
+        else:
+            last = len(lines) - 1
+            for i, line in enumerate(lines):
+                border = "LR" + ("T" if i == 0 else "") + ("B" if i == last else "")
+                self.cell(width, height, line, border, 2, 'L')
+        self.x = self.l_margin
+
+    def finalize_last_page(self):
+        """
+        Marks the current page as the last one when add_table has not already laid out the pages.
+        """
+        if self.page_count is None:
+            self.page_count = self.page
+
+    def number_to_words(self, n):
+        """
+        Converts a number into words.
+        """
+        return number_to_words(n)
+
+
+class _FileBuffer:
+    """
+    Stands in for FPDF.buffer: appended text goes straight to a binary file and
+    len() reports the bytes written so far, which is what FPDF uses for offsets.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.size = 0
+
+    def __iadd__(self, s):
+        data = s.encode("latin-1")
+        self.f.write(data)
+        self.size += len(data)
+        return self
+
+    def __len__(self):
+        return self.size
+
+
+class StreamingReceiptPDF(ReceiptPDF):
+    """
+    ReceiptPDF that writes each page to a file as soon as it is finished.
+
+    Page objects keep the numbers FPDF would give them (3, 5, 7, ... with
+    their content right after), so only the page tree, resources and xref
+    are left for close(). The table is paginated as line items arrive, and
+    the total page count in "Page X of Y" is a small form XObject written
+    at the end.
+    """
+
+    def __init__(self, f):
+        super().__init__()
+        self.buffer = _FileBuffer(f)
+        self.layout_first = False
+
+    def draw_page_number(self):
+        self.set_y(-24)
+        self.set_font("Arial", "I", 8)
+        label = f"Page {self.page} of "
+        x = self.w - self.r_margin - 35
+        self.set_x(x)
+        self.cell(0, 8, label, align="L")
+
+        # Place the page count form right after the label, on the same baseline
+        if ("page_count",) not in self.templates:
+            self.templates[("page_count",)] = (len(self.templates) + 1, "")
+        tx = (x + self.c_margin + self.get_string_width(label)) * self.k
+        ty = (self.h - (self.get_y() + 4 + .3 * self.font_size)) * self.k
+        self._out(f"q 1 0 0 1 {tx:.2f} {ty:.2f} cm /TPL{self.templates[('page_count',)][0]} Do Q")
+
+    def _endpage(self):
+        super()._endpage()
+        if self.page == 1:
+            super()._putheader()
+
+        # Write the page object and its compressed content, then drop the content
+        self._newobj()
+        self._out("<</Type /Page")
+        self._out("/Parent 1 0 R")
+        self._out("/Resources 2 0 R")
+        if self.pdf_version > "1.3":
+            self._out("/Group <</Type /Group /S /Transparency /CS /DeviceRGB>>")
+        self._out(f"/Contents {self.n + 1} 0 R>>")
+        self._out("endobj")
+        content = self.pages[self.page].encode("latin-1")
+        if self.compress:
+            content = zlib.compress(content)
+        self._newobj()
+        self._out(("<</Filter /FlateDecode " if self.compress else "<<") + f"/Length {len(content)}>>")
+        self._putstream(content)
+        self._out("endobj")
+        self.pages[self.page] = ""
+
+    def _putheader(self):
+        pass  # Written before the first page
+
+    def _putpages(self):
+        # Pages root only; the pages themselves are already in the file
+        self.offsets[1] = len(self.buffer)
+        self._out("1 0 obj")
+        self._out("<</Type /Pages")
+        self._out("/Kids [" + "".join(f"{3 + 2 * i} 0 R " for i in range(self.page)) + "]")
+        self._out(f"/Count {self.page}")
+        self._out(f"/MediaBox [0 0 {self.fw_pt:.2f} {self.fh_pt:.2f}]")
+        self._out(">>")
+        self._out("endobj")
+
+    def _putimages(self):
+        # The page count is only known now
+        if ("page_count",) in self.templates:
+            index = self.templates[("page_count",)][0]
+            font = self.fonts["helveticaI"]["i"]
+            self.templates[("page_count",)] = (index, f"BT /F{font} 8.00 Tf 0 0 Td ({self.page}) Tj ET")
+        super()._putimages()
+
+
+def number_to_words(n):
+    """
+    Converts a number into words.
+    """
+    units = ["", "One", "Two", "Three", "Four", "Five", "Six",
+             "Seven", "Eight", "Nine"]
+    teens = ["", "Eleven", "Twelve", "Thirteen", "Fourteen",
+             "Fifteen", "Sixteen", "Seventeen", "Eighteen", "Nineteen"]
+    tens = ["", "Ten", "Twenty", "Thirty", "Forty", "Fifty",
+            "Sixty", "Seventy", "Eighty", "Ninety"]
+    thousands = ["", "Thousand", "Million", "Billion"]
+
+    def convert_chunk(chunk):
+        words = []
+        if chunk >= 100:
+            words.append(units[chunk // 100] + " Hundred")
+            chunk %= 100
+        if 10 < chunk < 20:
+            words.append(teens[chunk - 10])
+        else:
+            if chunk >= 10:
+                words.append(tens[chunk // 10])
+            if chunk % 10 > 0:
+                words.append(units[chunk % 10])
+        return " ".join(words)
+
+    if n == 0:
+        return "Zero"
+
+    words = []
+    chunk_count = 0
+    while n > 0:
+        chunk = n % 1000
+        if chunk > 0:
+            words.append(convert_chunk(chunk) + " " + thousands[chunk_count])
+        n //= 1000
+        chunk_count += 1
+
+    return " ".join(reversed(words)).strip()
+
+
+# Validation
+class InvoiceError(ValueError):
+    """Raised when invoice data is missing or invalid."""
+
+    def __init__(self, message, title="Input Error"):
+        super().__init__(message)
+        self.title = title  # Dialog title used by the GUI
+
+
+UNICODE_FONT_MISSING = ("Bangla text needs a Unicode font. Put NotoSansBengali-Regular.ttf "
+                        "(and NotoSansBengali-Bold.ttf) in the fonts folder.")
+
+
+def check_printable(text):
+    """
+    Raises InvoiceError when text needs the Unicode font and none is installed.
+    """
+    if needs_unicode_font(text) and unicode_font_path() is None:
+        raise InvoiceError(UNICODE_FONT_MISSING, title="Font Error")
+
+
+def calculate_totals(medicines, advance):
+    """
+    Returns (total, due) for a list of (description, qty, price) line items.
+    """
+    total_amount = sum(qty * price for _, qty, price in medicines)
+    return total_amount, total_amount - advance
+
+
+def validate_customer(invoice):
+    """
+    Checks everything in an invoice dict except the line items and returns a normalized copy.
+
+    The copy has stripped customer fields, "paid" as a float and
+    "folder_date" in yyyy-mm-dd form; "medicines" is passed through as given.
+    "invoice_number" is kept as given (None when missing): numbers are only
+    taken from the sequence once the whole invoice is known to be good (see
+    assign_invoice_number). Raises InvoiceError with the same messages the GUI shows.
+    """
+    customer_name = str(invoice.get("name", "")).strip()
+    customer_address = str(invoice.get("address", "")).strip()
+    customer_mobile = str(invoice.get("mobile", "")).strip()
+    advance_amount = str(invoice.get("paid", "")).strip()
+    date_str = str(invoice.get("date", "")).strip()
+
+    if not customer_name:
+        raise InvoiceError("Name is required.")
+
+    check_printable(customer_name)
+    check_printable(customer_address)
+
+    if not customer_mobile.isdigit():
+        raise InvoiceError("Mobile number must contain only digits.")
+
+    if not advance_amount:
+        raise InvoiceError("Paid amount is required.")
+
+    try:
+        advance = float(advance_amount)
+    except ValueError:
+        raise InvoiceError("Advance amount must contain only digits and at most one decimal point.")
+    if not math.isfinite(advance) or advance < 0:  # "inf", "nan" and "-5" parse, but the form never allows them
+        raise InvoiceError("Advance amount must contain only digits and at most one decimal point.")
+
+    # Parse the selected date from 'dd/mm/yyyy' to 'yyyy-mm-dd'
+    try:
+        selected_date = datetime.strptime(date_str, '%d/%m/%Y').strftime('%Y-%m-%d')
+    except ValueError:
+        raise InvoiceError("Invalid date format. Please select a valid date.", title="Date Error")
+
+    return {
+        "name": customer_name,
+        "address": customer_address,
+        "mobile": customer_mobile,
+        "date": date_str,
+        "folder_date": selected_date,
+        "paid": advance,
+        "medicines": invoice.get("medicines") or [],
+        "invoice_number": invoice.get("invoice_number") or None,
+    }
+
+
+def parse_line_item(item):
+    """Accept a [description, qty, price] list or a {"description", "qty", "price"} object."""
+    if isinstance(item, dict):
+        return item.get("description"), item.get("qty"), item.get("price")
+    return tuple(item)
+
+
+def iter_line_items(medicines):
+    """
+    Yields line items as (description, qty, price) tuples, checking each one as it is consumed
+    with the same rules as the GUI's Add Medicine button.
+    """
+    seen = set()
+    for medicine in medicines:
+        try:
+            description, qty, price = medicine
+            if isinstance(qty, float) and not qty.is_integer():
+                raise ValueError  # int() would silently drop the fraction
+            description, qty, price = str(description).strip(), int(qty), float(price)
+        except (TypeError, ValueError, OverflowError):
+            raise InvoiceError("Quantity must be an integer and Price must be a number.")
+        if not description:
+            raise InvoiceError("Medicine Details, Quantity, and Price are required fields.")
+        if qty < 0 or not math.isfinite(price):
+            raise InvoiceError("Quantity must be an integer and Price must be a number.")
+        if price <= 0:
+            raise InvoiceError("Price must be greater than 0.")
+        if description in seen:
+            raise InvoiceError(f"{description}: This medicine description already exists.")
+        seen.add(description)
+        check_printable(description)
+        yield description, qty, price
+
+
+def check_total(total_amount, advance):
+    if advance > total_amount:
+        raise InvoiceError(f"Paid amount ({advance:.2f}) cannot exceed the total amount ({total_amount:.2f}).")
+
+
+@timed("validate")
+def validate_invoice(invoice, assign_number=True):
+    """
+    Checks an invoice dict and returns a normalized copy (see validate_customer)
+    with the line items as a list of (description, qty, price) tuples.
+
+    An invoice without a number gets the next one from the sequence, but only
+    after every check has passed, so rejected invoices leave no gaps. With
+    assign_number=False the caller assigns it later (see assign_invoice_number).
+    """
+    invoice = validate_customer(invoice)
+    invoice["medicines"] = list(iter_line_items(invoice["medicines"]))
+
+    if not invoice["medicines"]:
+        raise InvoiceError("At least one medicine must be added to generate the receipt.")
+
+    # Calculate total amount
+    total_amount, _ = calculate_totals(invoice["medicines"], invoice["paid"])
+    check_total(total_amount, invoice["paid"])
+    if assign_number:
+        assign_invoice_number(invoice)
+    return invoice
+
+
+# Invoice numbers and file layout
+invoice_numbers = InvoiceNumbers()  # Shared sequence; the database is opened on first use
+
+
+def new_invoice_number():
+    return invoice_numbers.allocate()
+
+
+def assign_invoice_number(invoice):
+    """
+    Gives a validated invoice without a number the next one from the sequence. Returns the invoice.
+    """
+    if not invoice["invoice_number"]:
+        invoice["invoice_number"] = new_invoice_number()
+    return invoice
+
+
+def receipt_filename(invoice_number, customer_name):
+    sanitized_name = customer_name.replace(" ", "_").replace("/", "-")
+    return f"receipt_{invoice_number}_{sanitized_name}.pdf"
+
+
+def receipt_relpath(invoice):
+    """
+    Returns the <yyyy-mm-dd>/receipt_<INV...>_<name>.pdf path of a validated invoice within the receipts folder.
+    """
+    return os.path.join(invoice["folder_date"], receipt_filename(invoice["invoice_number"], invoice["name"]))
+
+
+def receipt_path(invoice, base_dir="Receipts"):
+    """
+    Returns the Receipts/<yyyy-mm-dd>/receipt_<INV...>_<name>.pdf path for a validated invoice.
+    """
+    return os.path.join(base_dir, receipt_relpath(invoice))
+
+
+# Rendering
+@timed("layout")
+def build_receipt(invoice):
+    """
+    Lays out a validated invoice and returns the finished ReceiptPDF.
+    """
+    pdf = ReceiptPDF()
+    pdf.add_page()
+    pdf.invoice_details(invoice_no=invoice["invoice_number"], date=invoice["date"])  # Pass the selected date in original format
+    pdf.customer_details(name=invoice["name"], address=invoice["address"], mobile=invoice["mobile"])
+    pdf.add_table(invoice["medicines"], invoice["paid"])
+    pdf.finalize_last_page()
+    return pdf
+
+
+def stream_receipt(invoice, f):
+    """
+    Renders a validated invoice (see validate_customer) page by page into the binary file f.
+
+    invoice["medicines"] may be any iterable, including a generator over a
+    huge supplier invoice: line items are checked as they are consumed and
+    every finished page is written out immediately, so memory stays flat
+    however long the invoice is. Raises InvoiceError if the items turn out
+    to be invalid; f then holds an incomplete document.
+    """
+    with timing_receipt(invoice["invoice_number"]):  # One timing record per streamed receipt
+        stream_pages(invoice, f)
+
+
+@timed("stream")
+def stream_pages(invoice, f):
+    count = [0]
+
+    def counted(medicines):
+        for medicine in iter_line_items(medicines):
+            count[0] += 1
+            yield medicine
+
+    pdf = StreamingReceiptPDF(f)
+    pdf.add_page()
+    pdf.invoice_details(invoice_no=invoice["invoice_number"], date=invoice["date"])
+    pdf.customer_details(name=invoice["name"], address=invoice["address"], mobile=invoice["mobile"])
+    total_amount = pdf.add_table(counted(invoice["medicines"]), invoice["paid"])
+    if not count[0]:
+        raise InvoiceError("At least one medicine must be added to generate the receipt.")
+    check_total(total_amount, invoice["paid"])
+    pdf.finalize_last_page()
+    pdf.close()
+
+
+def stream_to_path(invoice, base_dir="Receipts", sink=None):
+    """
+    Like render_to_path, but streams pages to disk as they are finished (see stream_receipt).
+    The receipt only appears under its name once complete; nothing is left behind if the
+    line items turn out to be invalid. The invoice number is printed on the first page,
+    so it is taken when streaming starts and is used up if the line items fail.
+    """
+    invoice = assign_invoice_number(validate_customer(invoice))
+    sink = sink or FileSink(base_dir)
+    relative_path = receipt_relpath(invoice)
+    with sink.open(relative_path) as f:
+        stream_receipt(invoice, f)
+    return sink.location(relative_path)
+
+
+def pdf_bytes(pdf):
+    """
+    Returns the document as bytes (PyFPDF returns a latin-1 str, fpdf2 a bytearray).
+    """
+    data = pdf.output(dest="S")
+    if isinstance(data, str):
+        data = data.encode("latin-1")
+    return bytes(data)
+
+
+def render_receipt(invoice):
+    """
+    Validates an invoice dict and returns the receipt PDF as bytes.
+    """
+    return pdf_bytes(build_receipt(validate_invoice(invoice)))
+
+
+def render_to_path(invoice, base_dir="Receipts", cache=None, sink=None):
+    """
+    Validates an invoice dict, writes the receipt under base_dir/<yyyy-mm-dd>/ and returns the path.
+    """
+    return write_receipt(validate_invoice(invoice), base_dir, cache, sink)
+
+
+def write_receipt(invoice, base_dir="Receipts", cache=None, sink=None):
+    """
+    Like render_to_path, for an invoice that has already been through validate_invoice.
+    With a cache (see render_cache.RenderCache), an identical earlier render is reused.
+    The receipt is stored through sink (see storage.py), by default written atomically
+    under base_dir; returns where it was stored.
+    """
+    pdf = build_receipt(invoice) if cache is None else None
+
+    # Serializing and storing; a cache miss lays the receipt out in here too (also timed as "layout")
+    with stage("output"):
+        data = cache.render(invoice) if pdf is None else pdf_bytes(pdf)
+        return (sink or FileSink(base_dir)).write(receipt_relpath(invoice), data)
@@ -0,0 +1,140 @@
+"""
+Content-addressed cache of rendered receipts.
+
+Reprints, customer/office copies and retried batch jobs render the same
+invoice again. The cache keys each PDF by a SHA-256 of the normalized
+invoice (number, customer fields, date, paid amount, line items) plus the
+template version, the output profile (render.OPTIMIZE_OUTPUT) and the size and modification time of the logo and the
+Unicode fonts, so a hit can be served without touching ReceiptPDF and any
+change that would alter the output gives a new key.
+
+Entries are files under render_cache/<2 hex>/<hash>.pdf, written atomically
+so several processes can share the directory. A hit refreshes the file's
+modification time, and when the store grows past max_bytes the least
+recently used files are removed until it is back under 90% of the limit.
+"""
+import hashlib
+import json
+import os
+import threading
+
+from fonts import font_signature, unicode_font_path
+import render  # render.OPTIMIZE_OUTPUT is read at call time, so toggling it changes the key
+from render import LOGO_PATH, TEMPLATE_VERSION, build_receipt, pdf_bytes
+from storage import write_atomic
+
+CACHE_DIR = "render_cache"
+CACHE_SIZE = 256 * 1024 * 1024  # Bytes kept on disk before evicting
+
+
+def cache_key(invoice):
+    """
+    Returns the hex SHA-256 key for a validated invoice (see render.validate_invoice).
+    """
+    try:
+        logo = os.stat(LOGO_PATH)
+        logo_signature = [logo.st_size, logo.st_mtime_ns]
+    except OSError:
+        logo_signature = None
+    fonts = sorted({unicode_font_path(style) for style in ("", "B")} - {None})
+    normalized = [
+        TEMPLATE_VERSION,
+        render.OPTIMIZE_OUTPUT,
+        logo_signature,
+        [list(font_signature(path)) for path in fonts],
+        invoice["invoice_number"],
+        invoice["name"],
+        invoice["address"],
+        invoice["mobile"],
+        invoice["date"],
+        repr(float(invoice["paid"])),
+        [[description, qty, repr(float(price))] for description, qty, price in invoice["medicines"]],
+    ]
+    return hashlib.sha256(json.dumps(normalized, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, path=CACHE_DIR, max_bytes=CACHE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = sum(size for _, size, _ in self.entries())  # Bytes on disk, as far as this process knows
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], f"{key}.pdf")
+
+    def entries(self):
+        """
+        Yields (last used time, size, path) for every cached file.
+        """
+        if not os.path.isdir(self.path):
+            return
+        for folder in os.scandir(self.path):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if entry.name.endswith(".pdf"):
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:  # Evicted by another process
+                        continue
+                    yield st.st_mtime, st.st_size, entry.path
+
+    def get(self, key):
+        """
+        Returns the cached PDF bytes for key, or None.
+        """
+        path = self.entry_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Mark as recently used
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, key, data):
+        write_atomic(self.entry_path(key), data, sync=False)  # A cache entry lost in a crash is only a miss
+        with self.lock:
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+
+    def evict(self):
+        """
+        Removes least recently used files until the store is under 90% of max_bytes. Call with self.lock held.
+        """
+        entries = sorted(self.entries())
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
+            self.evictions += 1
+
+    def render(self, invoice):
+        """
+        Returns the PDF bytes for a validated invoice, rendering and storing them on a miss.
+        """
+        key = cache_key(invoice)
+        data = self.get(key)
+        if data is None:
+            data = pdf_bytes(build_receipt(invoice))
+            self.put(key, data)
+        return data
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "bytes": self.size}
@@ -0,0 +1,280 @@
+"""
+Daily and monthly sales summaries from the invoice ledger.
+
+The aggregates (revenue, paid vs. due, per-day totals, top medicines by
+quantity and by amount, outstanding dues per customer) are computed inside
+SQLite with set-based GROUP BY queries over the ledger's indexes and its
+per-day medicine rollup, so a year of data (millions of line items) is
+summarized without touching individual line items or looping over rows in
+Python. The summary is rendered as a PDF with the receipt's header.
+
+Usage:
+    python reports.py day 2024-09-15
+    python reports.py month 2024-09
+"""
+from calendar import monthrange
+from datetime import datetime
+import argparse
+import os
+import sys
+
+from ledger import LEDGER_PATH, Ledger
+from render import ReceiptPDF
+
+TOP_MEDICINES = 10  # Rows in each "top medicines" table
+TOP_DUES = 50  # Rows in the outstanding dues table
+
+
+def sales_summary(ledger, date_from, date_to, top=TOP_MEDICINES, dues_limit=TOP_DUES):
+    """
+    Aggregates the ledger between two inclusive yyyy-mm-dd dates.
+
+    Returns a dict with "totals" (invoices, items, revenue, paid, due),
+    "daily" rows (date, invoices, revenue, paid, due), "top_by_qty" and
+    "top_by_amount" rows (description, qty, amount), and "dues" rows
+    (name, mobile, invoices, due) with each customer's unpaid balance over
+    all invoices up to date_to.
+    """
+    db = ledger.db
+    period = (date_from, date_to)
+
+    totals = db.execute(
+        "SELECT COUNT(*), COALESCE(SUM(total), 0), COALESCE(SUM(paid), 0) "
+        "FROM invoices WHERE folder_date BETWEEN ? AND ?",
+        period,
+    ).fetchone()
+    daily = db.execute(
+        "SELECT folder_date, COUNT(*), SUM(total), SUM(paid), SUM(total - paid) "
+        "FROM invoices WHERE folder_date BETWEEN ? AND ? GROUP BY folder_date ORDER BY folder_date",
+        period,
+    ).fetchall()
+
+    # One pass over the period's daily rollup, ranked both ways in SQL
+    medicines_sql = (
+        "WITH sold AS ("
+        " SELECT description, SUM(lines) AS lines, SUM(qty) AS qty, SUM(amount) AS amount"
+        " FROM daily_sales WHERE folder_date BETWEEN ? AND ? GROUP BY description)"
+        " SELECT 'items', NULL, SUM(lines), NULL FROM sold"
+        " UNION ALL"
+        " SELECT * FROM (SELECT 'qty', description, qty, amount FROM sold ORDER BY qty DESC, amount DESC LIMIT ?)"
+        " UNION ALL"
+        " SELECT * FROM (SELECT 'amount', description, qty, amount FROM sold ORDER BY amount DESC, qty DESC LIMIT ?)"
+    )
+    items = 0
+    top_by_qty = []
+    top_by_amount = []
+    for ranking, description, qty, amount in db.execute(medicines_sql, period + (top, top)):
+        if ranking == "items":
+            items = qty or 0
+        else:
+            (top_by_qty if ranking == "qty" else top_by_amount).append((description, qty, amount))
+
+    dues = db.execute(
+        "SELECT name, mobile, COUNT(*), SUM(total - paid) AS due FROM invoices "
+        "WHERE folder_date <= ? AND total - paid > 0.005 "
+        "GROUP BY mobile, name ORDER BY due DESC LIMIT ?",
+        (date_to, dues_limit),
+    ).fetchall()
+
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {
+            "invoices": totals[0],
+            "items": items,
+            "revenue": totals[1],
+            "paid": totals[2],
+            "due": totals[1] - totals[2],
+        },
+        "daily": [tuple(row) for row in daily],
+        "top_by_qty": top_by_qty,
+        "top_by_amount": top_by_amount,
+        "dues": [tuple(row) for row in dues],
+    }
+
+
+def day_range(day):
+    """Returns (date_from, date_to) for a yyyy-mm-dd day."""
+    datetime.strptime(day, "%Y-%m-%d")  # Reject malformed dates early
+    return day, day
+
+
+def month_range(month):
+    """Returns (date_from, date_to) for a yyyy-mm month."""
+    first = datetime.strptime(month, "%Y-%m")
+    last_day = monthrange(first.year, first.month)[1]
+    return f"{month}-01", f"{month}-{last_day:02d}"
+
+
+def display_date(iso_date):
+    """yyyy-mm-dd -> dd/mm/yyyy, the way dates appear on receipts."""
+    return datetime.strptime(iso_date, "%Y-%m-%d").strftime("%d/%m/%Y")
+
+
+class ReportPDF(ReceiptPDF):
+    """
+    Receipt styling (header, fonts, bordered tables) for sales summaries,
+    without the receipt's signature block and "Sold Items Not Taken" box.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.set_auto_page_break(auto=True, margin=30)
+        self.alias_nb_pages()
+
+    def footer(self):
+        self.draw_chrome(("report footer",), self.draw_report_footer)
+        self.draw_page_number()
+
+    def draw_report_footer(self):
+        # "MAA MEDICAL CENTER" at the very bottom, as on receipts
+        self.set_y(-15)
+        self.set_font("Arial", "I", 8)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, "MAA MEDICAL CENTER " * 5, align="C")
+
+    def draw_page_number(self):
+        self.set_y(-24)
+        self.set_font("Arial", "I", 8)
+        self.cell(0, 8, f"Page {self.page} of {self.str_alias_nb_pages}", align="R")
+
+    def report_title(self, text):
+        self.set_font("Arial", "B", 12)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, text, ln=1, align="C")
+        self.ln(5)
+
+    def report_table(self, heading, columns, rows):
+        """
+        Draws a titled, bordered table. columns are (title, width fraction, align);
+        the column titles are repeated at the top of every page the table runs onto.
+        """
+        effective_width = self.w - self.l_margin - self.r_margin
+        widths = [fraction * effective_width for _, fraction, _ in columns]
+
+        def column_titles():
+            if not any(title for title, _, _ in columns):
+                return
+            self.set_font("Arial", "B", 10)
+            self.set_x(self.l_margin)
+            for (title, _, _), width in zip(columns, widths):
+                self.cell(width, 10, title, 1, align="C")
+            self.ln()
+            self.set_font("Arial", size=10)
+
+        # Keep the heading with the column titles and at least one row
+        if self.get_y() + 40 > self.page_break_trigger:
+            self.add_page()
+        self.set_font("Arial", "B", 11)
+        self.set_x(self.l_margin)
+        self.cell(0, 10, heading, ln=1)
+        self.set_font("Arial", size=10)
+        column_titles()
+
+        if not rows:
+            self.set_x(self.l_margin)
+            self.cell(effective_width, 10, "None", 1, align="C", ln=1)
+        for row in rows:
+            if self.get_y() + 10 > self.page_break_trigger:
+                self.add_page()
+                column_titles()
+            self.set_x(self.l_margin)
+            for value, (_, _, align), width in zip(row, columns, widths):
+                # Long medicine and customer names are cut to one line
+                text = self.wrap_text(width, str(value))[0]
+                self.cell(width, 10, text, 1, align=align)
+            self.ln()
+        self.ln(5)
+
+
+def money(amount):
+    return f"{amount:.2f}"
+
+
+def build_report(summary):
+    """
+    Lays out a sales_summary() result and returns the finished ReportPDF.
+    """
+    pdf = ReportPDF()
+    pdf.add_page()
+
+    if summary["date_from"] == summary["date_to"]:
+        pdf.report_title(f"DAILY SALES SUMMARY: {display_date(summary['date_from'])}")
+    else:
+        pdf.report_title(f"SALES SUMMARY: {display_date(summary['date_from'])} to {display_date(summary['date_to'])}")
+
+    totals = summary["totals"]
+    pdf.report_table("Totals", [("", 0.6, "L"), ("", 0.4, "R")], [
+        ("Invoices", totals["invoices"]),
+        ("Line items", totals["items"]),
+        ("Revenue", money(totals["revenue"])),
+        ("Paid", money(totals["paid"])),
+        ("Due", money(totals["due"])),
+    ])
+
+    if summary["date_from"] != summary["date_to"]:
+        pdf.report_table(
+            "Daily Totals",
+            [("Date", 0.25, "C"), ("Invoices", 0.15, "C"), ("Revenue", 0.2, "R"), ("Paid", 0.2, "R"), ("Due", 0.2, "R")],
+            [(display_date(day), count, money(revenue), money(paid), money(due))
+             for day, count, revenue, paid, due in summary["daily"]],
+        )
+
+    medicine_columns = [("#", 0.08, "C"), ("Medicine Details", 0.52, "L"), ("QTY", 0.15, "C"), ("Amount", 0.25, "R")]
+    pdf.report_table(
+        "Top Medicines by Quantity", medicine_columns,
+        [(rank, description, qty, money(amount)) for rank, (description, qty, amount) in enumerate(summary["top_by_qty"], 1)],
+    )
+    pdf.report_table(
+        "Top Medicines by Amount", medicine_columns,
+        [(rank, description, qty, money(amount)) for rank, (description, qty, amount) in enumerate(summary["top_by_amount"], 1)],
+    )
+
+    pdf.report_table(
+        f"Outstanding Dues up to {display_date(summary['date_to'])}",
+        [("Name", 0.4, "L"), ("Mobile No", 0.25, "C"), ("Invoices", 0.15, "C"), ("Due", 0.2, "R")],
+        [(name, mobile, count, money(due)) for name, mobile, count, due in summary["dues"]],
+    )
+    return pdf
+
+
+def report_path(summary, base_dir="Reports"):
+    """Reports/sales_<yyyy-mm-dd>.pdf for a day, Reports/sales_<from>_to_<to>.pdf for a range."""
+    if summary["date_from"] == summary["date_to"]:
+        name = f"sales_{summary['date_from']}.pdf"
+    else:
+        name = f"sales_{summary['date_from']}_to_{summary['date_to']}.pdf"
+    return os.path.join(base_dir, name)
+
+
+def write_report(ledger, date_from, date_to, base_dir="Reports"):
+    """
+    Summarizes the ledger between two yyyy-mm-dd dates, writes the PDF and returns its path.
+    """
+    summary = sales_summary(ledger, date_from, date_to)
+    pdf_path = report_path(summary, base_dir)
+    os.makedirs(base_dir, exist_ok=True)
+    build_report(summary).output(pdf_path)
+    return pdf_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a daily or monthly sales summary PDF.")
+    parser.add_argument("period", choices=("day", "month"))
+    parser.add_argument("date", help="yyyy-mm-dd for a day, yyyy-mm for a month")
+    parser.add_argument("--ledger", default=LEDGER_PATH, help="ledger database (default: ledger.db)")
+    parser.add_argument("--out", default="Reports", help="output folder (default: Reports)")
+    args = parser.parse_args(argv)
+
+    try:
+        date_from, date_to = day_range(args.date) if args.period == "day" else month_range(args.date)
+    except ValueError:
+        parser.error(f"invalid {args.period}: {args.date}")
+
+    with Ledger(args.ledger) as ledger:
+        print(write_report(ledger, date_from, date_to, args.out))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""
+Files shipped with the app (the logo, bundled fonts).
+
+They are found next to the source files, or inside the PyInstaller bundle
+when frozen (receipt.spec lists them in datas), never relative to the
+working directory, which is wherever the app or a batch job was started.
+"""
+import os
+import sys
+
+
+def resource_path(relative_path):
+    """
+    Returns the path of a file shipped with the app: inside the PyInstaller
+    bundle when frozen, else next to this module.
+    """
+    if getattr(sys, "frozen", False):
+        base_dir = getattr(sys, "_MEIPASS", os.path.dirname(sys.executable))
+    else:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(base_dir, relative_path)
@@ -0,0 +1,260 @@
+"""
+Local HTTP render service.
+
+Lets other programs on this machine (the ordering website, ward terminals)
+get receipt PDFs without the Tk app. Standard library only, bound to
+localhost by default.
+
+    POST /render   body: one invoice as JSON (the batch.py JSONL record form)
+                   200 application/pdf, 400 {"error", "title"} for invalid input,
+                   503 when the render queue is full (retry after a second)
+    GET  /stats    request counts, cache hits/misses and p50/p99 latency in JSON
+    GET  /health   "ok"
+
+Requests are validated on the handler thread and looked up in the render
+cache (render_cache.py) first, so repeated copies of a receipt never reach
+the pool. Only invoices that arrive with their own number are cached; one
+numbered by the service is new by definition and could never be asked for
+again. Rendering runs in a process pool started with the service. Each worker
+renders a throwaway receipt and loads the Unicode font metrics when it
+starts, so the logo, fonts, page chrome and text-wrap caches are warm
+before the first real request. Requests are
+handled on threads; at most --max-pending renders are queued or running,
+and further requests are turned away with 503 instead of piling up.
+
+Usage:
+    python service.py --port 8765 --workers 4
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+import fonts
+from render import (InvoiceError, assign_invoice_number, build_receipt, parse_line_item, pdf_bytes,
+                    render_receipt, validate_invoice)
+from render_cache import RenderCache, cache_key
+import timing
+
+HOST = "127.0.0.1"
+PORT = 8765
+MAX_BODY = 10 * 1024 * 1024  # Largest accepted invoice JSON, in bytes
+LATENCY_WINDOW = 10000  # Recent requests kept for the percentiles
+
+WARM_INVOICE = {
+    "name": "Warm Up",
+    "address": "",
+    "mobile": "0",
+    "paid": "0",
+    "date": "01/01/2024",
+    "invoice_number": "INVWARMUP",
+    "medicines": [(f"Medicine {i}", 1, 1.0) for i in range(1, 21)],
+}
+
+
+def warm_worker():
+    """Pool initializer: fills the per-process caches before any request arrives."""
+    render_receipt(WARM_INVOICE)
+    fonts.preload()
+
+
+def render_validated(invoice):
+    """Pool job: renders an invoice that the service has already validated."""
+    with timing.receipt(invoice["invoice_number"]):
+        pdf = build_receipt(invoice)
+        with timing.stage("output"):
+            return pdf_bytes(pdf)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class RenderService:
+    def __init__(self, workers=None, max_pending=None, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.cache = cache
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_worker)
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)  # Seconds per successful render, most recent last
+        self.requests = 0
+        self.errors = 0
+        self.rejected = 0
+        self.in_flight = 0
+
+    def start(self):
+        # Start every worker now rather than on the first requests
+        wait([self.pool.submit(time.sleep, 0.1) for _ in range(self.workers)])
+
+    def render(self, invoice):
+        """
+        Validates an invoice dict and returns the PDF bytes, from the cache or rendered in the pool.
+        Returns None without rendering when max_pending renders are already queued. Invoices
+        without a number are numbered here and bypass the cache.
+        """
+        started = time.perf_counter()
+        with self.lock:
+            self.requests += 1
+        try:
+            invoice = validate_invoice(invoice, assign_number=False)  # Numbered below, once it will be rendered
+        except InvoiceError:
+            with self.lock:
+                self.errors += 1
+            raise
+
+        key = cache_key(invoice) if self.cache and invoice["invoice_number"] else None
+        data = self.cache.get(key) if key else None
+        if data is None:
+            if not self.slots.acquire(blocking=False):
+                with self.lock:
+                    self.rejected += 1
+                return None
+            with self.lock:
+                self.in_flight += 1
+            try:
+                # Rejected requests never reach this point, so they use up no invoice number
+                if not invoice["invoice_number"]:
+                    assign_invoice_number(invoice)  # key stays None: a fresh number is never requested twice
+                data = self.pool.submit(render_validated, invoice).result()
+            except Exception:
+                with self.lock:
+                    self.errors += 1
+                raise
+            finally:
+                self.slots.release()
+                with self.lock:
+                    self.in_flight -= 1
+            if key:
+                self.cache.put(key, data)
+
+        with self.lock:
+            self.latencies.append(time.perf_counter() - started)
+        return data
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "requests": self.requests,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "in_flight": self.in_flight,
+            }
+        for name, fraction in (("p50_ms", 0.50), ("p99_ms", 0.99)):
+            value = percentile(latencies, fraction)
+            stats[name] = round(value * 1000, 2) if value is not None else None
+        if self.cache:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    service = None  # Set by serve()
+
+    def send_json(self, status, payload, headers=()):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.service.stats())
+        elif self.path == "/health":
+            self.send_json(200, "ok")
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/render":
+            self.send_json(404, {"error": "Not found"})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.send_json(413, {"error": "Invoice too large."})
+            return
+        try:
+            invoice = json.loads(self.rfile.read(length))
+            invoice["medicines"] = [parse_line_item(item) for item in invoice.get("medicines") or []]
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_json(400, {"error": f"Invalid JSON invoice: {e}", "title": "Input Error"})
+            return
+
+        try:
+            data = self.service.render(invoice)
+        except InvoiceError as e:
+            self.send_json(400, {"error": str(e), "title": e.title})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        if data is None:
+            self.send_json(503, {"error": "Render queue is full."}, headers=[("Retry-After", "1")])
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Keep the console quiet; /stats has the numbers
+
+
+def serve(host=HOST, port=PORT, workers=None, max_pending=None, cache=True):
+    """
+    Starts the worker pool and serves until interrupted or terminated.
+    """
+    server = ThreadingHTTPServer((host, port), RenderHandler)
+    server.daemon_threads = True
+    service = RenderService(workers, max_pending, RenderCache() if cache else None)
+    service.start()
+    RenderHandler.service = service
+    # Stop cleanly on SIGTERM too, so the pool's workers are not left behind
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Rendering receipts on http://{host}:{server.server_port} with {service.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve receipt PDFs over HTTP on this machine.")
+    parser.add_argument("--host", default=HOST, help="address to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=PORT, help="port (default: 8765)")
+    parser.add_argument("--workers", type=int, default=None, help="render processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=None,
+                        help="renders queued or running before new requests get 503 (default: 4 per worker)")
+    parser.add_argument("--no-cache", action="store_true", help="always render, never use the render cache")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.max_pending, cache=not args.no_cache)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
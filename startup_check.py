@@ -0,0 +1,123 @@
+"""
+Startup-time check for the receipt app.
+
+Launches the app (from source, or the frozen build with --frozen), waits
+until its main window is shown and reports the time from launch to window,
+the median over several runs. The app is started with the environment
+variable RECEIPT_STARTUP_REPORT pointing at a temporary file; receipt.py
+writes the time the window appeared and the modules imported by then to it
+and quits.
+
+Source runs also use python -X importtime and list the slowest imports
+done before the window appeared, by cumulative time. The frozen build
+cannot take -X options, so it only lists the modules it imported.
+
+The check fails (exit status 1) when any of the modules meant to load
+after the window (fpdf, tkcalendar, ...) was imported before it, or the
+median startup is over --budget seconds. Needs a display (for example
+under xvfb-run).
+
+Usage:
+    python startup_check.py
+    python startup_check.py --frozen dist/receipt/receipt.exe --runs 5 --budget 2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules the window must not wait for (see the imports in receipt.py)
+DEFERRED_MODULES = ["fpdf", "tkcalendar", "babel", "render", "render_cache", "ledger", "archive", "random"]
+TIMEOUT = 60  # Seconds to wait for the window before giving up
+
+
+def parse_importtime(stderr):
+    """
+    Returns {module: (self microseconds, cumulative microseconds)} from python -X importtime output.
+    """
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue  # Column header
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def run_once(command, report_path):
+    """
+    Starts the app once and returns (seconds to window, report dict, stderr).
+    """
+    if os.path.exists(report_path):
+        os.remove(report_path)
+    env = dict(os.environ, RECEIPT_STARTUP_REPORT=report_path)
+    started = time.time()
+    process = subprocess.run(command, env=env, capture_output=True, text=True, timeout=TIMEOUT)
+    if not os.path.exists(report_path):
+        raise RuntimeError(f"the app exited with status {process.returncode} before showing its window:\n"
+                           f"{process.stderr.strip()}")
+    with open(report_path, encoding="utf-8") as f:
+        report = json.load(f)
+    return report["shown_at"] - started, report, process.stderr
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long the receipt app takes to show its window.")
+    parser.add_argument("--frozen", help="path of the PyInstaller executable (default: run receipt.py from source)")
+    parser.add_argument("--runs", type=int, default=5, help="launches to take the median over (default: 5)")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="fail when the median startup is over this many seconds")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list (default: 15)")
+    args = parser.parse_args(argv)
+
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY"):
+        print("No display; run under xvfb-run or on a desktop.", file=sys.stderr)
+        return 2
+
+    if args.frozen:
+        command = [os.path.abspath(args.frozen)]
+    else:
+        command = [sys.executable, "-X", "importtime", os.path.join(os.path.dirname(os.path.abspath(__file__)), "receipt.py")]
+
+    seconds = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report_path = os.path.join(tmp_dir, "startup.json")
+        for _ in range(args.runs):
+            elapsed, report, stderr = run_once(command, report_path)
+            seconds.append(elapsed)
+
+    # Imports and modules from the last run
+    loaded = set(report["modules"])
+    median = statistics.median(seconds)
+    print(f"{'frozen' if args.frozen else 'source'} startup to window: median {median * 1000:.0f} ms, "
+          f"min {min(seconds) * 1000:.0f} ms over {len(seconds)} runs, {len(loaded)} modules loaded")
+
+    times = parse_importtime(stderr)
+    if times:
+        print("Slowest imports before the window (cumulative / self, ms):")
+        before = sorted(((cumulative, own, name) for name, (own, cumulative) in times.items() if name in loaded),
+                        reverse=True)
+        for cumulative, own, name in before[:args.top]:
+            print(f"  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {name}")
+
+    failed = False
+    early = [name for name in DEFERRED_MODULES if name in loaded]
+    if early:
+        print(f"FAIL imported before the window: {', '.join(early)}")
+        failed = True
+    if args.budget is not None and median > args.budget:
+        print(f"FAIL median startup {median:.2f} s is over the {args.budget:.2f} s budget")
+        failed = True
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
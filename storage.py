@@ -0,0 +1,356 @@
+"""
+Receipt storage sinks.
+
+Rendering produces PDF bytes; a sink decides where they end up. Every sink
+takes a path relative to its root, such as "2024-09-15/receipt_INV..._Name.pdf"
+(see render.receipt_relpath), and returns where the receipt was stored.
+
+- FileSink writes under a folder (Receipts/ by default). Each receipt goes
+  to a temporary file next to its final name, is synced to disk and then
+  renamed over the final name, so a reader (or a crash) never sees a
+  half-written PDF under a receipt's name, and concurrent writers of the
+  same receipt simply replace each other's complete copies. Folders are
+  created idempotently. With batch_size, the fsyncs are grouped: written
+  receipts are staged and, every batch_size receipts (and on flush), all
+  staged files are synced, renamed and each folder synced once, which
+  keeps batch runs fast while still never exposing a torn file.
+- MemorySink keeps receipts in a dict, for tests and previews.
+- ArchiveSink appends receipts straight into the daily archive packs (see
+  archive.py). Safe across threads of one process only.
+
+atomic_file and write_atomic apply the same temporary file and rename rule
+to any other file the app rewrites (render cache entries, font caches, the
+timing metrics), so it lives in one place.
+
+Usage (stress test: many processes and threads writing the same folder):
+    python storage.py stress --processes 4 --threads 8 --receipts 200
+"""
+from contextlib import contextmanager
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from timing import stage
+
+RECEIPTS_DIR = "Receipts"
+
+
+def temp_path_for(path):
+    # Unique per writer, in the same folder so the rename never crosses file systems
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def sync_directory(path):
+    """
+    Makes renames in a folder durable. Windows cannot open folders and needs no directory sync.
+    """
+    if os.name == "nt":
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_file(path, sync=True):
+    """
+    Yields a binary file that replaces path only if the block completes. It is
+    written to a temporary file in the same folder, synced (with sync) and
+    renamed over path, so readers and crashes never see a partial file;
+    otherwise the temporary file is removed.
+    """
+    temp_path = temp_path_for(path)
+    try:
+        with open(temp_path, "wb") as f:
+            yield f
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    if sync:
+        sync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def write_atomic(path, data, sync=True):
+    """
+    Writes data to path through atomic_file, creating the folder if needed.
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    with atomic_file(path, sync) as f:
+        f.write(data)
+
+
+class FileSink:
+    def __init__(self, base_dir=RECEIPTS_DIR, sync=True, batch_size=None):
+        self.base_dir = base_dir
+        self.sync = sync  # fsync files and folders; False still renames atomically
+        self.batch_size = batch_size if sync and batch_size and batch_size > 1 else None
+        self.lock = threading.Lock()
+        self.staged = {}  # Temp path -> final path, written but not yet synced and renamed
+        self.folders = set()  # Folders known to exist
+
+    def make_folder(self, folder):
+        if folder not in self.folders:
+            with stage("makedirs"):
+                os.makedirs(folder, exist_ok=True)  # Safe when another worker creates it first
+            self.folders.add(folder)
+
+    @contextmanager
+    def open(self, relative_path):
+        """
+        Yields a binary file for the receipt. The receipt appears under its final
+        name only if the block completes; otherwise the temporary file is removed.
+        """
+        path = os.path.join(self.base_dir, relative_path)
+        self.make_folder(os.path.dirname(path))
+        if not self.batch_size:
+            with atomic_file(path, self.sync) as f:
+                yield f
+            return
+
+        # Batched: write now, sync and rename with the rest of the group in flush()
+        temp_path = temp_path_for(path)
+        try:
+            with open(temp_path, "wb") as f:
+                yield f
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        with self.lock:
+            self.staged[temp_path] = path  # A rewrite by the same writer replaces its staged copy
+            full = len(self.staged) >= self.batch_size
+        if full:
+            self.flush()
+
+    def write(self, relative_path, data):
+        """
+        Stores data as relative_path under base_dir and returns the final path.
+        With batch_size, the file gets its final name on the next flush.
+        """
+        with self.open(relative_path) as f:
+            f.write(data)
+        return self.location(relative_path)
+
+    def location(self, relative_path):
+        return os.path.join(self.base_dir, relative_path)
+
+    def flush(self):
+        """
+        Syncs and renames the staged receipts, then syncs each of their folders once.
+        """
+        with self.lock:
+            staged, self.staged = self.staged, {}
+        for temp_path in staged:
+            with open(temp_path, "rb+") as f:  # Windows only flushes handles opened for writing
+                os.fsync(f.fileno())
+        for temp_path, path in staged.items():
+            os.replace(temp_path, path)
+        for folder in {os.path.dirname(path) for path in staged.values()}:
+            sync_directory(folder)
+
+    def close(self):
+        self.flush()
+
+    def flush_at_exit(self):
+        """
+        Flushes staged receipts when this process exits normally, including process pool workers.
+        """
+        from multiprocessing import util
+        util.Finalize(self, self.flush, exitpriority=10)
+        return self
+
+
+class MemorySink:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.files = {}  # Relative path -> bytes
+
+    @contextmanager
+    def open(self, relative_path):
+        f = io.BytesIO()
+        yield f
+        self.write(relative_path, f.getvalue())
+
+    def write(self, relative_path, data):
+        with self.lock:
+            self.files[relative_path] = bytes(data)
+        return self.location(relative_path)
+
+    def location(self, relative_path):
+        return relative_path
+
+    def read(self, relative_path):
+        with self.lock:
+            return self.files.get(relative_path)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ArchiveSink:
+    """
+    Appends receipts to Archive/<yyyy-mm-dd>.pack. The first folder of the
+    relative path is the day; returns "<pack path>#<file name>".
+    """
+
+    def __init__(self, path=None):
+        from archive import ARCHIVE_DIR
+        self.path = path or ARCHIVE_DIR
+        self.lock = threading.Lock()  # One appender per pack file at a time
+        self.local = threading.local()  # .archive: this thread's Archive (SQLite connections stay on their thread)
+
+    def archive(self):
+        archive = getattr(self.local, "archive", None)
+        if archive is None:
+            from archive import Archive
+            archive = self.local.archive = Archive(self.path)
+        return archive
+
+    @contextmanager
+    def open(self, relative_path):
+        f = io.BytesIO()
+        yield f
+        self.write(relative_path, f.getvalue())
+
+    def write(self, relative_path, data):
+        day, name = os.path.split(os.path.normpath(relative_path))
+        with self.lock:
+            self.archive().append(day, [(name, data)])
+        return self.location(relative_path)
+
+    def location(self, relative_path):
+        day, name = os.path.split(os.path.normpath(relative_path))
+        return f"{os.path.join(self.path, day)}.pack#{name}"
+
+    def flush(self):
+        pass
+
+    def close(self):
+        archive = getattr(self.local, "archive", None)
+        if archive is not None:
+            archive.close()
+            self.local.archive = None
+
+
+# Stress test
+def stress_worker(base_dir, worker, threads, receipts, batch_size):
+    """
+    Writes receipts from several threads; half the names are shared by every writer, half are this worker's own.
+    """
+    sink = FileSink(base_dir, batch_size=batch_size)
+
+    def write_all(thread):
+        for i in range(receipts):
+            owner = "shared" if i % 2 else f"w{worker}-t{thread}"
+            data = stress_receipt(f"{owner}-{i}", worker, thread, i)
+            sink.write(os.path.join(f"2024-01-{i % 28 + 1:02d}", f"receipt_{owner}-{i}.pdf"), data)
+
+    pool = [threading.Thread(target=write_all, args=(thread,)) for thread in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    sink.close()
+
+
+def stress_receipt(name, worker, thread, i):
+    # A PDF-like file whose size varies by writer, so a mix of two writers' bytes is detectable
+    body = f"{name} {worker} {thread} ".encode("ascii") * (200 + (worker * 31 + thread * 7 + i) % 300)
+    return b"%PDF-1.3\n" + len(body).to_bytes(4, "big") + body + b"\n%%EOF\n"
+
+
+def check_stress_output(base_dir):
+    """
+    Returns (receipts, problems): every file must be a complete stress receipt and no temporary files may remain.
+    """
+    receipts = 0
+    problems = []
+    for folder, _, names in os.walk(base_dir):
+        for name in names:
+            path = os.path.join(folder, name)
+            if name.endswith(".tmp"):
+                problems.append(f"{path}: temporary file left behind")
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            size = int.from_bytes(data[9:13], "big") if len(data) >= 13 else -1
+            if not data.startswith(b"%PDF-1.3\n") or not data.endswith(b"\n%%EOF\n") or len(data) != size + 20:
+                problems.append(f"{path}: torn or mixed content ({len(data)} bytes)")
+            receipts += 1
+    return receipts, problems
+
+
+def stress(processes=4, threads=8, receipts=200, batch_size=None, base_dir=None):
+    """
+    Runs processes x threads writers against one folder and checks the result. Returns a list of problems.
+    """
+    import multiprocessing
+
+    own_dir = base_dir is None
+    base_dir = base_dir or tempfile.mkdtemp(prefix="receipt_stress_")
+    try:
+        started = time.perf_counter()
+        pool = [multiprocessing.Process(target=stress_worker, args=(base_dir, worker, threads, receipts, batch_size))
+                for worker in range(processes)]
+        for process in pool:
+            process.start()
+        for process in pool:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        problems = [f"worker {worker} exited with {process.exitcode}"
+                    for worker, process in enumerate(pool) if process.exitcode]
+        count, file_problems = check_stress_output(base_dir)
+        problems.extend(file_problems)
+        expected = processes * threads * (receipts - receipts // 2) + receipts // 2  # Own names plus shared ones
+        if count != expected:
+            problems.append(f"{count} receipts on disk, expected {expected}")
+        writes = processes * threads * receipts
+        print(f"{writes} writes by {processes * threads} writers in {elapsed:.2f}s "
+              f"({writes / elapsed:.0f}/s), {count} receipts checked, {len(problems)} problems")
+        return problems
+    finally:
+        if own_dir:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receipt storage tools.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stress_parser = commands.add_parser("stress", help="write receipts from many processes and threads and check them")
+    stress_parser.add_argument("--processes", type=int, default=4)
+    stress_parser.add_argument("--threads", type=int, default=8, help="writer threads per process")
+    stress_parser.add_argument("--receipts", type=int, default=200, help="receipts per writer")
+    stress_parser.add_argument("--batch-size", type=int, default=None, help="group fsyncs (default: one per receipt)")
+    stress_parser.add_argument("--dir", help="folder to write into (default: a temporary folder, removed afterwards)")
+    args = parser.parse_args(argv)
+
+    problems = stress(args.processes, args.threads, args.receipts, args.batch_size, args.dir)
+    for problem in problems[:20]:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""
+Optional per-stage timing for receipt generation.
+
+Disabled unless the RECEIPT_TIMING environment variable is set (to anything
+but "" or "0") when the app starts. While disabled, @timed returns the
+function unchanged and stage() returns a shared no-op context, so the
+instrumented code runs as if it were not instrumented.
+
+When enabled, stage timings are collected per receipt: everything timed on
+a thread inside receipt(invoice_number) is summed by stage name (nested
+stages are counted in both, e.g. "header" is also part of "layout") and
+written as one JSON line to receipt_timings.jsonl. Each stage's per-receipt
+time, plus the receipt's total, also goes into a histogram that is
+rewritten to receipt_metrics.prom in the Prometheus textfile format after
+every receipt. A receipt() inside another one is part of the outer receipt.
+Stages timed outside receipt() are summed in memory and written as one
+record (with no invoice number) together with the next receipt, and when
+the process exits, so untracked code never writes to disk per call.
+RECEIPT_TIMING_LOG and RECEIPT_METRICS override the two paths.
+"""
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+import atexit
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("RECEIPT_TIMING", "") not in ("", "0")
+LOG_PATH = os.environ.get("RECEIPT_TIMING_LOG", "receipt_timings.jsonl")
+METRICS_PATH = os.environ.get("RECEIPT_METRICS", "receipt_metrics.prom")
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_local = threading.local()  # .trace: stage name -> [seconds, calls] for the receipt being timed on this thread
+_lock = threading.Lock()
+_histograms = {}  # Stage name -> [bucket counts..., +Inf count, sum]
+_loose = {}  # Stage name -> [seconds, calls] timed outside receipt(), not yet written
+_NO_OP = nullcontext()
+
+
+def timed(name):
+    """
+    Decorator that times every call of the function as stage name. A no-op when timing is disabled.
+    """
+    def decorate(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with _stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def stage(name):
+    """
+    Context manager that times its block as stage name. A no-op when timing is disabled.
+    """
+    return _stage(name) if ENABLED else _NO_OP
+
+
+@contextmanager
+def _stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        trace = getattr(_local, "trace", None)
+        if trace is None:
+            with _lock:
+                add(_loose, name, seconds)
+        else:
+            add(trace, name, seconds)
+
+
+def add(stages, name, seconds):
+    totals = stages.setdefault(name, [0.0, 0])
+    totals[0] += seconds
+    totals[1] += 1
+
+
+@contextmanager
+def receipt(invoice_number):
+    """
+    Collects the stages timed on this thread inside the block into one record for invoice_number.
+    """
+    if not ENABLED or getattr(_local, "trace", None) is not None:
+        yield  # Disabled, or already inside a receipt this one belongs to
+        return
+    _local.trace = {}
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        trace, _local.trace = _local.trace, None
+        record(invoice_number, seconds, trace)
+
+
+def record(invoice_number, seconds, stages):
+    """
+    Appends one JSON line for a receipt, preceded by one for the stages timed
+    outside receipt() since the last write, and updates the histograms, then
+    rewrites the metrics file.
+    """
+    with _lock:
+        entries = []
+        if _loose:
+            entries.append(log_entry(None, None, _loose))  # Not one receipt: the stages only
+            for name, (total, _) in _loose.items():
+                observe(name, total)
+            _loose.clear()
+        if stages is not None:
+            entries.append(log_entry(invoice_number, seconds, stages))
+            observe("receipt", seconds)
+            for name, (total, _) in stages.items():
+                observe(name, total)
+        if not entries:
+            return
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        write_metrics()
+
+
+def log_entry(invoice_number, seconds, stages):
+    return {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "pid": os.getpid(),
+        "invoice_number": invoice_number,
+        "seconds": None if seconds is None else round(seconds, 6),
+        "stages": {name: {"seconds": round(total, 6), "calls": calls} for name, (total, calls) in stages.items()},
+    }
+
+
+def flush():
+    """
+    Writes the stages timed outside receipt() that no receipt has written yet. Runs at exit.
+    """
+    record(None, None, None)
+
+
+def observe(name, seconds):
+    histogram = _histograms.setdefault(name, [0] * (len(BUCKETS) + 1) + [0.0])
+    for i, bound in enumerate(BUCKETS):
+        if seconds <= bound:
+            histogram[i] += 1
+    histogram[len(BUCKETS)] += 1  # +Inf bucket, which is also the count
+    histogram[-1] += seconds
+
+
+def worker_label():
+    # Worker processes (batch runs) each keep their own file and series next to the main process's
+    return "main" if multiprocessing.parent_process() is None else str(os.getpid())
+
+
+def metrics_path():
+    if worker_label() == "main":
+        return METRICS_PATH
+    root, ext = os.path.splitext(METRICS_PATH)
+    return f"{root}-{worker_label()}{ext}"
+
+
+def write_metrics():
+    """
+    Writes the histograms in the Prometheus text format, replacing the file atomically.
+    """
+    lines = [
+        "# HELP receipt_stage_seconds Time spent per receipt in each stage of receipt generation.",
+        "# TYPE receipt_stage_seconds histogram",
+    ]
+    for name in sorted(_histograms):
+        histogram = _histograms[name]
+        labels = f'worker="{worker_label()}",stage="{name}"'
+        for bound, count in zip(BUCKETS, histogram):
+            lines.append(f'receipt_stage_seconds_bucket{{{labels},le="{bound:g}"}} {count}')
+        lines.append(f'receipt_stage_seconds_bucket{{{labels},le="+Inf"}} {histogram[len(BUCKETS)]}')
+        lines.append(f'receipt_stage_seconds_sum{{{labels}}} {histogram[-1]:.6f}')
+        lines.append(f'receipt_stage_seconds_count{{{labels}}} {histogram[len(BUCKETS)]}')
+
+    from storage import write_atomic  # storage imports this module, so it is imported on first use
+    write_atomic(metrics_path(), ("\n".join(lines) + "\n").encode("utf-8"), sync=False)
+
+
+if ENABLED:
+    atexit.register(flush)